@@ -0,0 +1,170 @@
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from config import GENERAL_CONFIG
+from peer import PeerClient
+from failure_detector import PhiAccrualFailureDetector
+from digest import ContainerStateDigest
+from metrics import HEARTBEAT_INTERARRIVAL_SECONDS
+
+server_configs = GENERAL_CONFIG
+
+
+class PeerNode:
+    """Another agent of the cluster and everything this node knows about it"""
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.client = PeerClient(
+            url,
+            connect_timeout=server_configs.peer_connect_timeout,
+            read_timeout=server_configs.peer_read_timeout
+        )
+        self.failure_detector = PhiAccrualFailureDetector(
+            threshold=server_configs.phi_threshold,
+            window_size=server_configs.phi_window_size,
+            min_std_deviation=server_configs.phi_min_std_deviation,
+            acceptable_pause=server_configs.phi_acceptable_pause
+        )
+        self.last_heartbeat: Optional[float] = None  # monotonic time of its last heartbeat
+        self.roles: Dict[str, Optional[str]] = {}  # group -> role it reported in its last heartbeat
+        self.digests: Dict[str, ContainerStateDigest] = defaultdict(ContainerStateDigest)  # group -> warm mirror of its container states while it's primary
+        self.digest_received_at: Dict[str, float] = {}
+        self.acked_digest_versions: Dict[str, Optional[int]] = {}  # group -> version of our digest it confirmed having
+        self.lease_grants: Dict[str, Tuple[int, float]] = {}  # group -> (epoch, send time of the heartbeat it accepted us as primary for)
+
+    def record_heartbeat(self, now: float, roles: Optional[Dict[str, str]] = None):
+        if self.last_heartbeat is not None:
+            HEARTBEAT_INTERARRIVAL_SECONDS.labels(self.name).observe(now - self.last_heartbeat)
+        self.last_heartbeat = now
+        self.failure_detector.heartbeat(now)
+        if roles is not None:
+            self.roles.update(roles)
+
+    def phi(self, now: float) -> float:
+        return self.failure_detector.phi(now)
+
+    def stats(self, now: float) -> dict:
+        stats = {"roles": dict(self.roles), "rtt": self.client.rtt_summary()}
+        if self.last_heartbeat is not None:
+            stats["seconds_since_last_heartbeat"] = now - self.last_heartbeat
+            stats["phi"] = self.phi(now)
+        if self.digest_received_at:
+            stats["digests"] = {
+                group: dict(self.digests[group].as_dict(), age=now - received_at)
+                for group, received_at in self.digest_received_at.items()
+            }
+        return stats
+
+
+class Cluster:
+    """
+    Membership of the failover cluster as seen from this node: an ordered
+    priority list of nodes, the peers' liveness and which peer is primary
+    for each failover group. The highest-priority live node takes over a
+    group when its primary is lost. Groups can have their own priority list,
+    so each node can be the preferred primary of some of them.
+    """
+    def __init__(self, node_name: str, priority: List[str], peers: Dict[str, str],
+                 group_priority: Optional[Dict[str, List[str]]] = None, witness_url: str = ""):
+        self.node_name = node_name
+        self.priority = priority
+        self.group_priority = group_priority or {}
+        # The witness votes on takeovers and counts towards lease quorums, but never runs containers
+        self.witness = PeerNode("witness", witness_url) if witness_url else None
+        self.peers = {name: PeerNode(name, url) for name, url in peers.items()}
+        self.heartbeat_timeout = server_configs.heartbeat_timeout
+        self.started_at = time.monotonic()
+
+    def record_heartbeat(self, name: str, roles: Optional[Dict[str, str]] = None) -> bool:
+        """Returns False for heartbeats from nodes that aren't part of the cluster"""
+        peer = self.peers.get(name)
+        if peer is None:
+            return False
+        peer.record_heartbeat(time.monotonic(), roles)
+        return True
+
+    def is_suspected(self, name: str, now: float) -> bool:
+        """
+        Whether the peer looks dead: its phi crossed the threshold or no heartbeat arrived
+        for heartbeat_timeout seconds. A peer never heard from only counts as dead once
+        this node has been up for heartbeat_timeout seconds.
+        """
+        peer = self.peers[name]
+        if peer.last_heartbeat is None:
+            return now - self.started_at > self.heartbeat_timeout
+        if now - peer.last_heartbeat > self.heartbeat_timeout:
+            return True
+        return peer.phi(now) >= peer.failure_detector.threshold
+
+    def is_alive(self, name: str, now: float) -> bool:
+        return name == self.node_name or not self.is_suspected(name, now)
+
+    def primary(self, group: str) -> Optional[PeerNode]:
+        """
+        The peer that reported being primary for the group in its last heartbeat, if any.
+        If several did, the one heard from most recently wins.
+        """
+        primaries = [peer for peer in self.peers.values() if peer.roles.get(group) == "primary"]
+        return max(primaries, key=lambda peer: peer.last_heartbeat, default=None)
+
+    def priority_of(self, group: Optional[str] = None) -> List[str]:
+        """Takeover order of the group's nodes, its preferred primary first"""
+        return self.group_priority.get(group, self.priority)
+
+    def preferred_primary(self, group: Optional[str] = None) -> str:
+        return self.priority_of(group)[0]
+
+    def outranks(self, name: str, group: Optional[str] = None) -> bool:
+        """
+        Whether node name wins a tie against this node for the group: two primary claims
+        at the same epoch are settled in favour of the node earlier in the group's
+        priority order, and of the lower node name between nodes missing from it.
+        """
+        priority = self.priority_of(group)
+        rank = lambda node: (priority.index(node) if node in priority else len(priority), node)
+        return rank(name) < rank(self.node_name)
+
+    def takeover_candidate(self, now: float, failed: List[str] = (), group: Optional[str] = None) -> Optional[str]:
+        """The highest-priority live node of the group apart from the failed ones"""
+        for name in self.priority_of(group):
+            if name not in failed and self.is_alive(name, now):
+                return name
+        return None
+
+    def quorum(self, group: Optional[str] = None) -> int:
+        """Number of the group's voters (its nodes and the witness), this one included, that make a majority"""
+        voters = len(self.priority_of(group)) + (1 if self.witness is not None else 0)
+        return voters // 2 + 1
+
+    def voters(self) -> List[PeerNode]:
+        """The peers that can grant this node a lease: the other nodes and the witness"""
+        return list(self.peers.values()) + ([self.witness] if self.witness is not None else [])
+
+    def lease_renewed_at(self, group: str, epoch: int) -> Optional[float]:
+        """
+        Latest time at which a quorum of the group's nodes accepted this node as primary
+        at the given epoch, counting this node itself. None if no quorum ever did.
+        """
+        needed = self.quorum(group) - 1
+        if needed <= 0:
+            return time.monotonic()
+        grants = sorted((sent_at for peer in self.voters()
+                         for grant_epoch, sent_at in [peer.lease_grants.get(group, (None, None))]
+                         if grant_epoch == epoch), reverse=True)
+        return grants[needed - 1] if len(grants) >= needed else None
+
+    def successors(self, group: Optional[str] = None) -> List[PeerNode]:
+        """Live peers in the group's priority order, the nodes this one hands it over to"""
+        now = time.monotonic()
+        return [self.peers[name] for name in self.priority_of(group)
+                if name in self.peers and self.is_alive(name, now)]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {peer.name: peer.stats(now) for peer in self.voters()}
+
+    def close(self):
+        for peer in self.voters():
+            peer.client.close()
@@ -1,6 +1,16 @@
 # config.py
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+@dataclass
+class ReadinessProbe:
+    type: str                       # "http", "tcp" or "exec"
+    url: str = ""                   # http: URL to GET
+    expected_status: int = 200      # http: status code that means ready
+    host: str = ""                  # tcp: host to connect to
+    port: int = 0                   # tcp: port to connect to
+    command: List[str] = field(default_factory=list)  # exec: command run inside the container, ready on exit code 0
+    timeout: float = 2              # seconds allowed for each attempt
 
 @dataclass
 class ServerConfig:
@@ -8,14 +18,56 @@ class ServerConfig:
     containers: List[str]
     endpoint: str
     port: int
+    dependencies: Dict[str, List[str]] = field(default_factory=dict)
+    readiness_probes: Dict[str, ReadinessProbe] = field(default_factory=dict)
+    unhealthy_thresholds: Dict[str, int] = field(default_factory=dict)
+    peers: Dict[str, str] = field(default_factory=dict)  # node name -> URL of every other agent, defaults to the endpoint
+    groups: Dict[str, List[str]] = field(default_factory=dict)  # group name -> containers that fail over together
 
 @dataclass
 class GeneralConfig:
-    heartbeat_interval: int
-    check_heartbeat_interval: int
-    heartbeat_timeout: int
-    startup_grace_period: int
-    restart_grace_period: int
+    heartbeat_interval: float
+    check_heartbeat_interval: float
+    heartbeat_timeout: float
+    startup_grace_period: float
+    restart_grace_period: float
+    reconcile_interval: float = 10
+    stop_workers: int = 8
+    stop_timeout: int = 30
+    start_workers: int = 8
+    start_timeout: int = 60
+    startup_poll_interval: float = 0.1
+    startup_poll_max_interval: float = 2
+    verification_checks: int = 3
+    verification_interval: float = 5
+    docker_workers: int = 8
+    peer_connect_timeout: float = 1
+    peer_read_timeout: float = 5
+    become_primary_timeout: float = 360
+    udp_heartbeat_enabled: bool = False
+    udp_heartbeat_port: int = 8001
+    udp_heartbeat_interval: float = 0.2
+    udp_heartbeat_secret: str = ""
+    udp_heartbeat_max_age: float = 5
+    phi_threshold: float = 8.0
+    phi_window_size: int = 100
+    phi_min_std_deviation: float = 0.5
+    phi_acceptable_pause: float = 0
+    warm_standby: bool = False
+    demotion_policy: str = "stop"
+    freeze_retention: float = 300
+    preflight_interval: float = 60
+    preflight_min_free_memory_mb: int = 0
+    preflight_min_free_disk_mb: int = 1024
+    preflight_disk_path: str = "/"
+    preflight_check_ports: bool = True
+    readiness_timeout: float = 120
+    readiness_initial_backoff: float = 0.1
+    readiness_max_backoff: float = 2
+    unhealthy_threshold: int = 1
+    lease_duration: float = 0
+    journal_dir: str = ""
+    journal_snapshot_interval: int = 100
 
 
 
@@ -24,7 +76,44 @@ GENERAL_CONFIG = GeneralConfig(
     check_heartbeat_interval=5,
     heartbeat_timeout=20,
     startup_grace_period=20,    # grace period for initial startup
-    restart_grace_period=30     # grace period for container restarts (in seconds)
+    restart_grace_period=30,    # grace period for container restarts (in seconds)
+    reconcile_interval=10,      # seconds between full status checks when no Docker events arrive
+    stop_workers=8,             # max number of containers stopped in parallel
+    stop_timeout=30,            # seconds allowed for each container to stop
+    start_workers=8,            # max number of containers started in parallel
+    start_timeout=60,           # seconds allowed for each container start call
+    startup_poll_interval=0.1,  # first delay between startup checks, doubled after every check
+    startup_poll_max_interval=2,# upper bound for the delay between startup checks
+    verification_checks=3,      # consecutive failed checks after the restart grace period before failover
+    verification_interval=5,    # seconds between those checks
+    docker_workers=8,           # threads available for blocking Docker API calls
+    peer_connect_timeout=1,     # seconds allowed to connect to the other agent
+    peer_read_timeout=5,        # seconds allowed to wait for each read from the other agent
+    become_primary_timeout=360, # seconds the other agent may take to answer /become_primary
+    udp_heartbeat_enabled=False,# also send lightweight heartbeats over UDP
+    udp_heartbeat_port=8001,    # UDP port both agents listen on for heartbeats
+    udp_heartbeat_interval=0.2, # seconds between UDP heartbeats
+    udp_heartbeat_secret="",    # shared secret used to sign UDP heartbeats, must match on both servers
+    udp_heartbeat_max_age=5,    # seconds after which a UDP heartbeat is dropped as a possible replay
+    phi_threshold=8.0,          # suspicion level at which the primary is considered down
+    phi_window_size=100,        # number of recent heartbeat inter-arrival times used for phi
+    phi_min_std_deviation=0.5,  # seconds, lower bound for the inter-arrival standard deviation
+    phi_acceptable_pause=0,     # seconds of extra heartbeat delay that are never suspicious
+    warm_standby=False,         # keep containers started but paused on the backup for sub-second promotion
+    demotion_policy="stop",     # "stop" or "freeze" the healthy containers when this node is demoted
+    freeze_retention=300,       # seconds frozen containers are kept for a fast failback
+    preflight_interval=60,      # seconds between takeover readiness checks on the backup
+    preflight_min_free_memory_mb=0,     # memory that must be available on the backup
+    preflight_min_free_disk_mb=1024,    # disk space that must be free on preflight_disk_path
+    preflight_disk_path="/",            # filesystem checked for free disk space
+    preflight_check_ports=True,         # check that published ports of stopped containers are free
+    readiness_timeout=120,      # seconds a container's readiness probe may take to pass
+    readiness_initial_backoff=0.1,      # first delay between readiness probe attempts, doubled after every attempt
+    readiness_max_backoff=2,    # upper bound for the delay between readiness probe attempts
+    unhealthy_threshold=1,      # times a container has to turn unhealthy before it counts as down
+    lease_duration=0,           # seconds a primary's lease lasts unless a quorum renews it, 0 disables leases
+    journal_dir="",             # where roles are journaled to survive restarts, e.g. "/var/lib/failover-agent", empty disables the journal
+    journal_snapshot_interval=100           # journal records after which a compact snapshot is written
 )
 
 # Server 1 Configuration File
@@ -35,7 +124,17 @@ SERVER1_CONFIG = ServerConfig(
         "container-2"
     ],
     endpoint="http://172.17.92.9:8000",  # URL of server 2
-    port=8000
+    port=8000,
+    groups={
+        "default": ["container-1", "container-2"]  # containers that fail over together
+    },
+    dependencies={
+        # "container-2": ["container-1"],  # container-2 starts once container-1 is running
+    },
+    readiness_probes={
+        # Promotion only completes once container-1 answers HTTP requests
+        # "container-1": ReadinessProbe(type="http", url="http://127.0.0.1:8080/health", expected_status=200),
+    }
 )
 
 # Server 2 Configuration File
@@ -46,5 +145,40 @@ SERVER2_CONFIG = ServerConfig(
         "container-2"
     ],
     endpoint="http://172.17.92.20:8000",  # URL of server 1
-    port=8000
+    port=8000,
+    groups={
+        "default": ["container-1", "container-2"]  # containers that fail over together
+    },
+    dependencies={
+        # "container-2": ["container-1"],  # container-2 starts once container-1 is running
+    },
+    readiness_probes={
+        # Promotion only completes once container-1 answers HTTP requests
+        # "container-1": ReadinessProbe(type="http", url="http://127.0.0.1:8080/health", expected_status=200),
+    }
 )
+
+# Order in which nodes take over: the first one starts as primary and the
+# highest-priority live node takes over whenever the primary is lost
+CLUSTER_PRIORITY = ["server1", "server2"]
+
+# Optional takeover order per failover group, overriding CLUSTER_PRIORITY.
+# The first node of a group's list is its preferred primary, so giving the
+# groups different first nodes spreads the load over all the nodes.
+GROUP_PRIORITY = {
+    # "db": ["server2", "server1"],
+}
+
+# Optional witness: an agent started with --witness, without containers, that
+# every node heartbeats. Its vote is required for a takeover, so a broken link
+# between the nodes can't make both of them primary. Requires lease_duration.
+WITNESS_URL = ""    # e.g. "http://172.17.92.30:8000", empty disables the witness
+WITNESS_PORT = 8000 # API port the witness listens on
+
+# Optional disk lease, an alternative to the witness for sites with shared storage
+# but no third host: takeovers have to win the group's lease slot in a file on a
+# path shared by all nodes. Requires lease_duration.
+DISK_LEASE_PATH = ""    # e.g. "/mnt/shared/failover.lease", empty disables the disk lease
+DISK_LEASE_SLOTS = 64   # lease slots preallocated in the file, one per failover group
+
+SERVER_CONFIGS = {config.name: config for config in [SERVER1_CONFIG, SERVER2_CONFIG]}
@@ -0,0 +1,69 @@
+import threading
+from typing import Dict, List, Optional
+
+
+class ContainerStateDigest:
+    """
+    Versioned summary of container states: per container its state and restart count.
+    The primary keeps one up to date from its snapshots and sends it along with its
+    heartbeats; the backup applies those payloads to keep a warm mirror.
+    The version is bumped on every change, and each entry remembers the version
+    it last changed at so only the changes since the peer's version need to be sent.
+    """
+    def __init__(self):
+        self.version = 0
+        self.containers: Dict[str, List] = {}  # name -> [state, restart_count]
+        self._changed_at: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def update(self, container_name: str, state: str, restart_count: int) -> bool:
+        """Record the container's current state, returns True if it changed"""
+        with self._lock:
+            if self.containers.get(container_name) == [state, restart_count]:
+                return False
+            self.version += 1
+            self.containers[container_name] = [state, restart_count]
+            self._changed_at[container_name] = self.version
+            return True
+
+    def payload(self, peer_version: Optional[int]) -> dict:
+        """
+        Heartbeat payload for a peer whose mirror is at peer_version:
+        only the version if nothing changed, the changed entries if the peer is
+        in sync with an older version, or everything if its version is unknown.
+        """
+        with self._lock:
+            if peer_version == self.version:
+                return {"version": self.version}
+            if peer_version is None or peer_version > self.version:
+                return {"version": self.version, "full": True, "containers": dict(self.containers)}
+            return {
+                "version": self.version,
+                "base": peer_version,
+                "containers": {name: value for name, value in self.containers.items()
+                               if self._changed_at[name] > peer_version}
+            }
+
+    def apply(self, payload: dict) -> bool:
+        """
+        Apply a payload from the primary to this mirror.
+        Returns False if the mirror is out of sync and needs a full digest.
+        """
+        with self._lock:
+            version = payload.get("version")
+            if payload.get("full"):
+                self.containers = {name: list(value) for name, value in payload.get("containers", {}).items()}
+                self.version = version
+                return True
+            if "containers" in payload:
+                if payload.get("base") != self.version:
+                    return False
+                for name, value in payload["containers"].items():
+                    self.containers[name] = list(value)
+                self.version = version
+                return True
+            return version == self.version
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"version": self.version, "containers": dict(self.containers)}
@@ -0,0 +1,175 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# magic, version, number of slots
+HEADER_FORMAT = struct.Struct("!4sBI")
+HEADER_MAGIC = b"FOLS"
+HEADER_VERSION = 1
+# group, owner node, epoch, renewal counter
+SLOT_FORMAT = struct.Struct("!16s16sQQ")
+MAX_NAME_BYTES = 16  # group and node names are stored in fixed 16-byte fields
+SLOT_SIZE = 64  # slot body, crc32 and padding; one aligned write per renewal
+
+
+@dataclass
+class LeaseSlot:
+    group: str
+    owner: str
+    epoch: int
+    counter: int  # bumped by the owner on every renewal
+
+
+def encode_slot(slot: LeaseSlot) -> bytes:
+    for name in (slot.group, slot.owner):
+        if len(name.encode()) > MAX_NAME_BYTES:
+            raise ValueError(f"{name!r} doesn't fit in a lease slot, names are limited to {MAX_NAME_BYTES} bytes")
+    body = SLOT_FORMAT.pack(slot.group.encode(), slot.owner.encode(), slot.epoch, slot.counter)
+    return (body + struct.pack("!I", zlib.crc32(body))).ljust(SLOT_SIZE, b"\0")
+
+
+def decode_slot(data: bytes) -> Optional[LeaseSlot]:
+    """Returns the slot, or None for a torn or corrupt write"""
+    body = data[:SLOT_FORMAT.size]
+    (crc,) = struct.unpack("!I", data[SLOT_FORMAT.size:SLOT_FORMAT.size + 4])
+    if crc != zlib.crc32(body):
+        return None
+    group, owner, epoch, counter = SLOT_FORMAT.unpack(body)
+    return LeaseSlot(group.rstrip(b"\0").decode(errors="replace"), owner.rstrip(b"\0").decode(errors="replace"), epoch, counter)
+
+
+class DiskLease:
+    """
+    Quorum backend for sites with shared storage but no third host. Each failover
+    group has a fixed slot in one preallocated file on the shared path, holding its
+    owner, epoch and a renewal counter. The primary bumps the counter on every
+    renewal; other nodes watch the counter on their own monotonic clock and only
+    consider the lease lost once it stopped moving for lease_duration seconds.
+    Slots are written in place with a single write plus fsync and carry a checksum,
+    so a torn write is detected instead of being trusted.
+    """
+    def __init__(self, path: str, node_name: str, groups: List[str], slots: int,
+                 lease_duration: float, settle_delay: float, logger: logging.Logger):
+        if len(groups) > slots:
+            raise ValueError(f"{len(groups)} failover groups don't fit in {slots} lease slots")
+        # Longer names would be cut short on disk and never match the name they're compared with
+        for name in [node_name, *groups]:
+            if len(name.encode()) > MAX_NAME_BYTES:
+                raise ValueError(f"Name {name!r} is longer than the {MAX_NAME_BYTES} bytes a lease slot can hold")
+        self.path = path
+        self.node_name = node_name
+        self.slot_index = {group: index for index, group in enumerate(sorted(groups))}  # same on every node
+        self.slots = slots
+        self.lease_duration = lease_duration
+        self.settle_delay = settle_delay  # seconds to wait before checking that a takeover write stuck
+        self.logger = logger
+        self.observed: Dict[str, Tuple[LeaseSlot, float]] = {}  # group -> last slot seen and when its counter last moved
+        self._lock = threading.Lock()
+        self._fd = self._open()
+
+    def _open(self) -> int:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = SLOT_SIZE * (self.slots + 1)
+        header = os.pread(fd, HEADER_FORMAT.size, 0)
+        if len(header) < HEADER_FORMAT.size or header == b"\0" * HEADER_FORMAT.size:
+            # New file: preallocate every slot so renewals never change the file size
+            os.ftruncate(fd, max(size, os.fstat(fd).st_size))
+            os.pwrite(fd, HEADER_FORMAT.pack(HEADER_MAGIC, HEADER_VERSION, self.slots).ljust(SLOT_SIZE, b"\0"), 0)
+            os.fsync(fd)
+        else:
+            magic, version, slots = HEADER_FORMAT.unpack(header)
+            if magic != HEADER_MAGIC or version != HEADER_VERSION or slots != self.slots:
+                os.close(fd)
+                raise ValueError(f"{self.path} isn't a lease file with {self.slots} slots")
+        return fd
+
+    def _offset(self, group: str) -> int:
+        return SLOT_SIZE * (self.slot_index[group] + 1)
+
+    def _read(self, group: str) -> Optional[LeaseSlot]:
+        data = os.pread(self._fd, SLOT_SIZE, self._offset(group))
+        if data == b"\0" * SLOT_SIZE:
+            return LeaseSlot(group, "", 0, 0)  # never written
+        slot = decode_slot(data)
+        if slot is not None and slot.group != group:
+            raise ValueError(f"Lease slot of group {group} belongs to group {slot.group}, the groups differ between nodes")
+        return slot
+
+    def _write(self, slot: LeaseSlot):
+        os.pwrite(self._fd, encode_slot(slot), self._offset(slot.group))
+        os.fsync(self._fd)
+
+    def observe(self, group: str) -> Optional[LeaseSlot]:
+        """Read the group's slot and note when its counter last moved"""
+        with self._lock:
+            slot = self._read(group)
+            if slot is None:
+                return None
+            now = time.monotonic()
+            previous = self.observed.get(group)
+            if previous is None or previous[0] != slot:
+                self.observed[group] = (slot, now)
+            return slot
+
+    def renew(self, group: str, epoch: int) -> Tuple[bool, Optional[LeaseSlot]]:
+        """
+        Renew our lease on the group at epoch. Fails, returning the slot, if another
+        node owns it at the same or a newer epoch: we've been fenced.
+        """
+        with self._lock:
+            slot = self._read(group)
+            if slot is None:
+                return False, None
+            if slot.owner and slot.owner != self.node_name and slot.epoch >= epoch:
+                return False, slot
+            if slot.owner == self.node_name and slot.epoch > epoch:
+                return False, slot
+            counter = slot.counter + 1 if slot.owner == self.node_name and slot.epoch == epoch else 0
+            renewed = LeaseSlot(group, self.node_name, epoch, counter)
+            self._write(renewed)
+            self.observed[group] = (renewed, time.monotonic())
+            return True, renewed
+
+    def acquire(self, group: str, epoch: int) -> bool:
+        """
+        Take the group's lease over at epoch. Only allowed for a newer epoch, once the
+        owner's counter stood still for lease_duration seconds. After writing we wait
+        settle_delay and check the slot is still ours, so of two nodes racing for it
+        exactly one wins.
+        """
+        slot = self.observe(group)
+        if slot is None:
+            return False
+        if slot.epoch >= epoch:
+            self.logger.warning(f"Disk lease of group {group} is already at epoch {slot.epoch}")
+            return False
+        if slot.owner and slot.owner != self.node_name:
+            _, moved_at = self.observed[group]
+            if time.monotonic() - moved_at < self.lease_duration:
+                self.logger.warning(f"Disk lease of group {group} is still being renewed by {slot.owner}")
+                return False
+        with self._lock:
+            self._write(LeaseSlot(group, self.node_name, epoch, 0))
+        time.sleep(self.settle_delay)
+        slot = self.observe(group)
+        won = slot is not None and slot.owner == self.node_name and slot.epoch == epoch
+        if won:
+            self.logger.info(f"Acquired disk lease of group {group} at epoch {epoch}")
+        return won
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                group: {"owner": slot.owner, "epoch": slot.epoch, "counter": slot.counter,
+                        "seconds_since_renewal_seen": now - moved_at}
+                for group, (slot, moved_at) in self.observed.items()
+            }
+
+    def close(self):
+        os.close(self._fd)
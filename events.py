@@ -0,0 +1,84 @@
+import threading
+import logging
+from typing import Callable, List, Optional
+
+# Container events that can mean a monitored container is no longer serving
+FAILURE_EVENTS = ["die", "oom", "kill", "stop", "health_status"]
+
+# Container events that can mean a container we're waiting for has come up
+STARTUP_EVENTS = ["start", "unpause"]
+
+
+class ContainerEventWatcher:
+    """
+    Subscribes to the Docker daemon's events stream for a fixed set of containers
+    and hands every matching event to a callback as soon as it arrives.
+    The stream is re-opened from the last seen event if the connection drops.
+    """
+    def __init__(self, docker_client, containers: List[str],
+                 callback: Callable[[str, str], None], logger: logging.Logger,
+                 events: Optional[List[str]] = None, reconnect_delay: float = 1):
+        self.docker_client = docker_client
+        self.containers = containers
+        self.callback = callback
+        self.logger = logger
+        self.events = events or FAILURE_EVENTS + STARTUP_EVENTS
+        self.reconnect_delay = reconnect_delay
+        self._stop_event = threading.Event()
+        self._stream = None
+        self._last_event_time = None
+
+    def _filters(self) -> dict:
+        return {
+            "type": "container",
+            "container": self.containers,
+            "event": self.events,
+        }
+
+    def watch(self):
+        """Consume the events stream until stopped, reconnecting on errors"""
+        while not self._stop_event.is_set():
+            try:
+                self._stream = self.docker_client.events(
+                    decode=True,
+                    filters=self._filters(),
+                    since=self._last_event_time
+                )
+                self.logger.info("Subscribed to Docker events stream")
+                for event in self._stream:
+                    if self._stop_event.is_set():
+                        break
+                    self._last_event_time = event.get("time", self._last_event_time)
+                    container_name = event.get("Actor", {}).get("Attributes", {}).get("name")
+                    action = event.get("Action") or event.get("status")
+                    if container_name in self.containers and action:
+                        self.callback(container_name, action)
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                self.logger.error(f"Docker events stream failed: {str(e)}")
+            finally:
+                self._close_stream()
+
+            self._stop_event.wait(self.reconnect_delay)
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def start(self):
+        """Start the watcher thread"""
+        self.watcher_thread = threading.Thread(
+            target=self.watch,
+            daemon=True
+        )
+        self.watcher_thread.start()
+
+    def stop(self):
+        """Stop the watcher thread"""
+        self._stop_event.set()
+        self._close_stream()
@@ -0,0 +1,55 @@
+import math
+from collections import deque
+from typing import Optional
+
+
+class PhiAccrualFailureDetector:
+    """
+    Phi accrual failure detector (Hayashibara et al.).
+    Keeps a sliding window of heartbeat inter-arrival times and turns the time
+    since the last heartbeat into a suspicion level phi: phi = 1 means a ~10%
+    chance the peer is still alive and just late, phi = 2 ~1%, phi = 3 ~0.1% and so on.
+    """
+    def __init__(self, threshold: float = 8.0, window_size: int = 100,
+                 min_std_deviation: float = 0.5, acceptable_pause: float = 0, min_samples: int = 3):
+        self.threshold = threshold
+        self.min_std_deviation = min_std_deviation  # seconds, keeps a very regular link from making phi explode
+        self.acceptable_pause = acceptable_pause  # seconds of extra delay that never count as suspicious
+        self.min_samples = min_samples
+        self.intervals = deque(maxlen=window_size)
+        self.last_heartbeat: Optional[float] = None
+
+    def heartbeat(self, now: float):
+        """Record a heartbeat arriving at now"""
+        if self.last_heartbeat is not None:
+            self.intervals.append(now - self.last_heartbeat)
+        self.last_heartbeat = now
+
+    def reset(self):
+        self.intervals.clear()
+        self.last_heartbeat = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether enough heartbeats arrived to say anything about the link"""
+        return len(self.intervals) >= self.min_samples
+
+    def phi(self, now: float) -> float:
+        if not self.ready:
+            return 0.0
+
+        mean = sum(self.intervals) / len(self.intervals)
+        variance = sum((i - mean) ** 2 for i in self.intervals) / len(self.intervals)
+        std_deviation = max(math.sqrt(variance), self.min_std_deviation)
+
+        # Logistic approximation of the normal CDF, accurate to ~1e-4.
+        # y is clamped so exp() stays finite; phi saturates at ~37 which is far above any sane threshold.
+        y = (now - self.last_heartbeat - mean - self.acceptable_pause) / std_deviation
+        y = max(-10.0, min(10.0, y))
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if y > 0:
+            return -math.log10(e / (1.0 + e))
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+    def is_available(self, now: float) -> bool:
+        return self.phi(now) < self.threshold
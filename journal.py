@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class RoleJournal:
+    """
+    Crash-safe record of this node's role and epoch per failover group.
+    Every transition is appended to a journal file and fsynced before it takes
+    effect. Every snapshot_interval records the current state is written to a
+    snapshot (write to a temporary file, fsync, rename) and the journal is
+    truncated, so loading it on boot only ever replays a few records.
+    """
+    def __init__(self, directory: str, node_name: str, logger: logging.Logger, snapshot_interval: int = 100):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.journal_path = os.path.join(directory, f"{node_name}.journal")
+        self.snapshot_path = os.path.join(directory, f"{node_name}.snapshot")
+        self.logger = logger
+        self.snapshot_interval = snapshot_interval
+        self.state: Dict[str, Tuple[str, int]] = {}  # group -> (role, epoch)
+        self.sequence = 0  # sequence number of the last record
+        self._records_since_snapshot = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self) -> Dict[str, Tuple[str, int]]:
+        """Restore the state from the snapshot and the records after it"""
+        with self._lock:
+            try:
+                with open(self.snapshot_path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+                self.sequence = snapshot["sequence"]
+                self.state = {group: (entry["role"], entry["epoch"]) for group, entry in snapshot["groups"].items()}
+            except FileNotFoundError:
+                pass
+
+            replayed = 0
+            valid_length = 0
+            try:
+                with open(self.journal_path, "rb") as journal_file:
+                    for line in journal_file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Only the last record can be torn by a crash, and it never took effect
+                            self.logger.warning("Dropped incomplete record at the end of the role journal")
+                            break
+                        valid_length += len(line)
+                        if record["sequence"] <= self.sequence:
+                            continue  # already part of the snapshot
+                        self.state[record["group"]] = (record["role"], record["epoch"])
+                        self.sequence = record["sequence"]
+                        replayed += 1
+                # New records must not be appended to a torn one
+                os.truncate(self.journal_path, valid_length)
+            except FileNotFoundError:
+                pass
+
+            self._records_since_snapshot = replayed
+            self._file = open(self.journal_path, "a")
+            return dict(self.state)
+
+    def record(self, group: str, role: str, epoch: int):
+        """Durably append a role transition of the group"""
+        with self._lock:
+            if self.state.get(group) == (role, epoch):
+                return
+            self.sequence += 1
+            self.state[group] = (role, epoch)
+            self._file.write(json.dumps({
+                "sequence": self.sequence,
+                "group": group,
+                "role": role,
+                "epoch": epoch,
+                "at": time.time()  # wall clock, only for people reading the journal
+            }) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._records_since_snapshot += 1
+            if self._records_since_snapshot >= self.snapshot_interval:
+                self._write_snapshot()
+
+    def _write_snapshot(self):
+        temporary_path = f"{self.snapshot_path}.tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump({
+                "sequence": self.sequence,
+                "groups": {group: {"role": role, "epoch": epoch} for group, (role, epoch) in self.state.items()}
+            }, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+        # Records up to the snapshot's sequence are skipped on load, so a crash before this is harmless
+        self._file.truncate(0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records_since_snapshot = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
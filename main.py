@@ -1,183 +1,752 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 import uvicorn
 import argparse
-import threading
+import docker
+import asyncio
 import time
-import requests
-from typing import Dict
-from monitor import ContainerMonitor, ServerConfig, ServerRole
-from config import SERVER1_CONFIG, SERVER2_CONFIG, GENERAL_CONFIG
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from monitor import ContainerMonitor, ServerConfig, ServerRole, setup_logger, startup_tiers
+from events import ContainerEventWatcher
+from udp_heartbeat import MAX_NODE_ID_BYTES, UdpHeartbeatSender, start_udp_receiver
+from scheduler import MonotonicTicker
+from cluster import Cluster
+from preflight import PreflightChecker
+from probes import PROBE_TYPES
+from witness import Witness
+from disk_lease import DiskLease
+from journal import RoleJournal
+from metrics import (REGISTRY, HEARTBEAT_RTT_SECONDS, HEARTBEAT_SEND_FAILURES_TOTAL, FAILOVER_PHASE_SECONDS,
+                     FAILOVERS_TOTAL, ROLE, EPOCH)
+from config import SERVER_CONFIGS, CLUSTER_PRIORITY, GROUP_PRIORITY, WITNESS_URL, WITNESS_PORT, DISK_LEASE_PATH, DISK_LEASE_SLOTS, GENERAL_CONFIG
 
 server_configs = GENERAL_CONFIG
 
 class HeartbeatMonitor:
-    def __init__(self, monitor, config):
-        self.monitor = monitor
-        self.config = config
-        self.last_heartbeat = 0
+    def __init__(self, monitors, cluster, logger, disk_lease=None):
+        self.monitors = monitors  # group name -> the ContainerMonitor of that failover group
+        self.cluster = cluster
+        self.logger = logger
+        self.disk_lease = disk_lease  # Optional DiskLease that decides takeovers instead of a witness
+        self.server_name = cluster.node_name
         self.heartbeat_interval = server_configs.heartbeat_interval  # seconds
         self.check_heartbeat_interval = server_configs.check_heartbeat_interval # seconds
-        self.heartbeat_timeout = server_configs.heartbeat_timeout   # seconds
-        self._stop_event = threading.Event()
-        self._failover_lock = threading.Lock()  # Add lock for failover process
+        self.udp_enabled = server_configs.udp_heartbeat_enabled
+        self.udp_interval = server_configs.udp_heartbeat_interval  # seconds
+        self.sender_ticker = MonotonicTicker(self.heartbeat_interval)
+        self.disk_lease_ticker = MonotonicTicker(self.heartbeat_interval)
+        self._loop = None
+        self.udp_ticker = MonotonicTicker(self.udp_interval)
+        self.udp_sender = None
+        self.udp_receiver = None
+        self._udp_transport = None
+        self._tasks = []
+        self._step_downs = set()  # Pending step-downs after being fenced
+        self._sends = set()  # Heartbeat sends in flight, referenced so they aren't garbage collected
+        self._takeovers: Dict[str, asyncio.Task] = {}  # group -> takeover in flight
+        self.failover_locks = {group: asyncio.Lock() for group in monitors}  # One failover at a time per group
         
-    def initiate_failover(self):
+    def receive_digest(self, server_name: str, group: str, payload: dict) -> Optional[int]:
         """
-        Centralized method to handle failover process.
+        Apply the container state digest of a group carried by a heartbeat from its primary.
+        Returns the mirrored version, or None to ask the primary for a full digest.
+        """
+        peer = self.cluster.peers[server_name]
+        if not peer.digests[group].apply(payload):
+            return None
+        peer.digest_received_at[group] = time.monotonic()
+        return peer.digests[group].version
+
+    def check_epochs(self, server_name: str, roles: Dict[str, str], epochs: Dict[str, int]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Fence a heartbeat's role claims against our epochs. A higher epoch means a newer
+        takeover happened: we adopt it, and step down if we were primary at an older one.
+        A primary claim at an older epoch than ours is stale and ignored.
+        Two nodes can claim the same epoch when both took over at once without a witness
+        or disk lease to vote. Such a tie goes to the node earlier in the group's priority
+        order (see Cluster.outranks): the other one steps down, whichever side receives
+        the heartbeat, so both nodes reach the same decision.
+        Returns the roles to record and the groups whose lease we grant the sender.
+        """
+        accepted, grants = {}, []
+        for group, role in roles.items():
+            monitor = self.monitors.get(group)
+            if monitor is None:
+                continue
+            epoch = epochs.get(group, 0)
+            if epoch > monitor.epoch:
+                if monitor.role == ServerRole.PRIMARY:
+                    self.logger.warning(f"Fenced: {server_name} is at epoch {epoch} of group {group}, we're still at {monitor.epoch}")
+                    self._step_down_soon(group)
+                monitor.epoch = epoch
+            if role == "primary":
+                if epoch < monitor.epoch:
+                    self.logger.warning(f"Ignored stale primary claim from {server_name} for group {group} at epoch {epoch}")
+                    continue
+                if monitor.role == ServerRole.PRIMARY and epoch == monitor.epoch:
+                    if not self.cluster.outranks(server_name, group):
+                        self.logger.warning(f"Ignored primary claim from {server_name} for group {group} at our epoch {epoch}, we outrank it")
+                        continue
+                    self.logger.warning(f"Fenced: {server_name} is also primary of group {group} at epoch {epoch} and outranks us")
+                    self._step_down_soon(group)
+                if monitor.role == ServerRole.BACKUP:
+                    grants.append(group)
+            accepted[group] = role
+        return accepted, grants
+
+    def _step_down_soon(self, group: str):
+        task = asyncio.create_task(self.step_down(group))
+        self._step_downs.add(task)
+        task.add_done_callback(self._step_downs.discard)
+
+    async def reconcile(self):
+        """
+        Exchange one round of heartbeats with every peer, and give up any restored
+        primary role a newer takeover has superseded, before touching any container.
+        """
+        await asyncio.gather(*(self._post_heartbeat(peer) for peer in self.cluster.voters()))
+        if self._step_downs:
+            await asyncio.gather(*self._step_downs)
+        self.logger.info(f"Reconciled roles with peers: {', '.join(f'{group}={monitor.role.value}@{monitor.epoch}' for group, monitor in self.monitors.items())}")
+
+    async def step_down(self, group: str):
+        """Give up the primary role of a group without handing it over, after being fenced or losing the lease"""
+        monitor = self.monitors[group]
+        async with self.failover_locks[group]:
+            if monitor.role == ServerRole.PRIMARY:
+                FAILOVERS_TOTAL.labels(group, "step_down").inc()
+                await monitor.run_docker(monitor.become_backup, monitor.containers)
+
+    def record_heartbeat(self, server_name: str, roles: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Called for every heartbeat received from another node, over HTTP or UDP.
+        Returns False if the sender isn't part of the cluster.
+        """
+        if not self.cluster.record_heartbeat(server_name, roles):
+            self.logger.warning(f"Ignored heartbeat from unknown node {server_name}")
+            return False
+        for group, role in (roles or {}).items():
+            monitor = self.monitors.get(group)
+            if role == "primary" and monitor is not None and monitor.role == ServerRole.PRIMARY:
+                self.logger.warning(f"Both this node and {server_name} claim to be primary for group {group}")
+        self.logger.debug(f"Heartbeat received from {server_name}")
+        return True
+
+    async def initiate_failover(self, group: str, primary):
+        """
+        Centralized method to handle failover process of one group.
         Returns True if failover was successful.
         """
-        with self._failover_lock:  # Ensure only one failover happens at a time
-            if self.monitor.role == ServerRole.BACKUP:
-                self.monitor.logger.info("Initiating failover process...")
-                if self.monitor.become_primary(self.config.containers):
-                    self.monitor.logger.info("Successfully took over as primary")
+        monitor = self.monitors[group]
+        async with self.failover_locks[group]:  # Ensure only one failover of the group happens at a time
+            if monitor.role == ServerRole.BACKUP:
+                monitor.logger.info("Initiating failover process...")
+                if group in primary.digest_received_at:
+                    age = time.monotonic() - primary.digest_received_at[group]
+                    monitor.logger.info(f"Primary's last known container states ({age:.1f}s old): {primary.digests[group].as_dict()}")
+                epoch = monitor.epoch + 1
+                with FAILOVER_PHASE_SECONDS.labels(group, "vote").time():
+                    granted = await self.request_vote(group, epoch)
+                if not granted:
+                    return False
+                # Heartbeats from a future primary shouldn't be judged by the old link's history
+                primary.failure_detector.reset()
+                FAILOVERS_TOTAL.labels(group, "takeover").inc()
+                with FAILOVER_PHASE_SECONDS.labels(group, "promote").time():
+                    promoted = await monitor.run_docker(monitor.become_primary, monitor.containers, epoch)
+                if promoted:
+                    # Until it says otherwise, the lost primary is no longer one
+                    primary.roles[group] = None
+                    monitor.logger.info("Successfully took over as primary")
                     return True
                 else:
-                    self.monitor.logger.error("Failed to take over as primary")
+                    monitor.logger.error("Failed to take over as primary")
             return False
 
-    def send_heartbeat(self):
-        """Send heartbeat if we're the primary server"""
-        while not self._stop_event.is_set():
-            if self.monitor.role == ServerRole.PRIMARY:
+    async def request_vote(self, group: str, epoch: int) -> bool:
+        """Ask the witness or the disk lease, if there is one, whether we may take the group over at epoch"""
+        if self.disk_lease is not None:
+            try:
+                if await asyncio.to_thread(self.disk_lease.acquire, group, epoch):
+                    return True
+                self.logger.warning(f"Didn't win the disk lease of group {group}, not taking over")
+            except Exception as e:
+                self.logger.error(f"Failed to acquire the disk lease of group {group}: {str(e)}")
+            return False
+        witness = self.cluster.witness
+        if witness is None:
+            return True
+        try:
+            response = await witness.client.post_async(
+                "/vote",
+                {"server": self.server_name, "group": group, "epoch": epoch},
+                deadline=server_configs.peer_read_timeout
+            )
+            if response.ok:
+                return True
+            self.logger.warning(f"Witness refused takeover of group {group}: {response.json().get('detail')}")
+        except asyncio.TimeoutError:
+            self.logger.error(f"Witness didn't answer the vote for group {group} within {server_configs.peer_read_timeout}s")
+        except Exception as e:
+            self.logger.error(f"Failed to ask the witness for a vote: {str(e)}")
+        return False
+
+    async def _post_heartbeat(self, peer):
+        payload = {
+            "server": self.server_name,
+            "roles": {group: monitor.role.value for group, monitor in self.monitors.items()},
+            "epochs": {group: monitor.epoch for group, monitor in self.monitors.items()},
+        }
+        if peer is not self.cluster.witness:
+            payload["digests"] = {
+                group: monitor.state_digest.payload(peer.acked_digest_versions.get(group))
+                for group, monitor in self.monitors.items() if monitor.role == ServerRole.PRIMARY
+            }
+        sent_at = time.monotonic()
+        try:
+            # A heartbeat must never take longer than the interval, or sends start piling up
+            response = await peer.client.post_async("/heartbeat", payload, deadline=self.heartbeat_interval)
+            body = response.json() if response.ok else {}
+            # Only the changes since these versions need to be sent next time
+            peer.acked_digest_versions = body.get("digest_versions", {})
+            for group, epoch in body.get("epochs", {}).items():
+                monitor = self.monitors.get(group)
+                if monitor is not None and monitor.role == ServerRole.PRIMARY and epoch > monitor.epoch:
+                    self.logger.warning(f"Fenced: {peer.name} knows epoch {epoch} of group {group}, we're still at {monitor.epoch}")
+                    monitor.epoch = epoch
+                    self._step_down_soon(group)
+            # With a disk lease, leases are renewed on disk rather than by the peers
+            for group in body.get("lease_grants", []) if self.disk_lease is None else []:
+                monitor = self.monitors.get(group)
+                if monitor is None or monitor.role != ServerRole.PRIMARY or payload["epochs"][group] != monitor.epoch:
+                    continue
+                # The lease counts from when the heartbeat was sent, the earliest the peer can have accepted it
+                peer.lease_grants[group] = (monitor.epoch, sent_at)
+                renewed_at = self.cluster.lease_renewed_at(group, monitor.epoch)
+                if renewed_at is not None:
+                    monitor.renew_lease(renewed_at)
+            HEARTBEAT_RTT_SECONDS.labels(peer.name).observe(peer.client.last_rtt)
+            self.logger.debug(f"Heartbeat sent to {peer.name} in {peer.client.last_rtt * 1000:.1f}ms")
+        except asyncio.TimeoutError:
+            HEARTBEAT_SEND_FAILURES_TOTAL.labels(peer.name, "timeout").inc()
+            self.logger.error(f"Failed to send heartbeat to {peer.name}: no answer within {self.heartbeat_interval}s")
+        except Exception as e:
+            HEARTBEAT_SEND_FAILURES_TOTAL.labels(peer.name, "error").inc()
+            self.logger.error(f"Failed to send heartbeat to {peer.name}: {str(e)}")
+
+    async def send_heartbeat(self):
+        """
+        Send a heartbeat to every other node and the witness, whatever our roles,
+        so each of them knows which nodes are alive to take over.
+        Heartbeats go out on fixed monotonic deadlines; each send runs as its own
+        task so its latency never shifts the schedule.
+        """
+        async for _ in self.sender_ticker.ticks():
+            for peer in self.cluster.voters():
+                task = asyncio.create_task(self._post_heartbeat(peer))
+                self._sends.add(task)
+                task.add_done_callback(self._sends.discard)
+    
+    async def send_udp_heartbeat(self):
+        """Send lightweight UDP heartbeats to every other node at udp_heartbeat_interval"""
+        async for _ in self.udp_ticker.ticks():
+            try:
+                self.udp_sender.send()
+            except Exception as e:
+                self.logger.error(f"Failed to send UDP heartbeat: {str(e)}")
+    
+    def _maintain_disk_lease(self, group: str):
+        """Renew the group's disk lease while we're its primary, watch it while we're a backup"""
+        monitor = self.monitors[group]
+        if monitor.role == ServerRole.PRIMARY:
+            started_at = time.monotonic()
+            renewed, slot = self.disk_lease.renew(group, monitor.epoch)
+            if renewed:
+                monitor.renew_lease(started_at)
+            elif slot is not None:
+                self.logger.warning(f"Fenced: {slot.owner} holds the disk lease of group {group} at epoch {slot.epoch}")
+                monitor.epoch = max(monitor.epoch, slot.epoch)
+                asyncio.run_coroutine_threadsafe(self.step_down(group), self._loop)
+        else:
+            slot = self.disk_lease.observe(group)
+            if slot is not None and slot.epoch > monitor.epoch:
+                monitor.epoch = slot.epoch
+
+    async def maintain_disk_leases(self):
+        """Renew or watch every group's disk lease once per heartbeat interval"""
+        async for _ in self.disk_lease_ticker.ticks():
+            for group in self.monitors:
                 try:
-                    requests.post(
-                        f"{self.monitor.other_server_url}/heartbeat",
-                        json={"server": self.monitor.server_name}
-                    )
-                    self.monitor.logger.debug(f"Heartbeat sent to backup server")
+                    await asyncio.to_thread(self._maintain_disk_lease, group)
                 except Exception as e:
-                    self.monitor.logger.error(f"Failed to send heartbeat: {str(e)}")
-            
-            time.sleep(self.heartbeat_interval)
-    
-    def check_heartbeat(self):
-        """Check heartbeat if we're the backup server"""
-        while not self._stop_event.is_set():
-            if self.monitor.role == ServerRole.BACKUP:
-                current_time = time.time()
-                if self.last_heartbeat > 0:  # Only check if we've received at least one heartbeat
-                    time_since_last_heartbeat = current_time - self.last_heartbeat
-                    if time_since_last_heartbeat > self.heartbeat_timeout:
-                        self.monitor.logger.warning("No heartbeat received from primary for too long!")
-                        self.initiate_failover()
+                    self.logger.error(f"Failed to access the disk lease of group {group}: {str(e)}")
+
+    def _lost_primary(self, group: str, now: float):
+        """The group's primary if we're its backup and it's suspected down, otherwise None"""
+        if self.monitors[group].role != ServerRole.BACKUP:
+            return None
+        primary = self.cluster.primary(group)
+        # Only check once we've heard from a primary
+        if primary is None or not self.cluster.is_suspected(primary.name, now):
+            return None
+        return primary
+
+    def _take_over_soon(self, group: str, primary):
+        task = asyncio.create_task(self.initiate_failover(group, primary))
+        self._takeovers[group] = task
+        task.add_done_callback(lambda _: self._takeovers.pop(group, None))
+
+    async def check_heartbeat(self):
+        """
+        Check the heartbeat of the primary of every group we're a backup for.
+        A primary is suspected once its phi accrual suspicion level crosses phi_threshold,
+        or in any case once no heartbeat arrived for heartbeat_timeout seconds. Only the
+        highest-priority live backup then takes over, the others keep waiting.
+        Every takeover runs as its own task, so a slow one doesn't hold up checking
+        and failing over the other groups.
+        """
+        while True:
+            current_time = time.monotonic()
+            for group in self.monitors:
+                if group in self._takeovers:
+                    continue
+                primary = self._lost_primary(group, current_time)
+                if primary is None:
+                    continue
+                time_since_last_heartbeat = current_time - primary.last_heartbeat
+                if time_since_last_heartbeat < server_configs.lease_duration:
+                    # The lost primary may still hold its lease, so it hasn't stepped down yet
+                    self.logger.info(f"Primary {primary.name} of group {group} suspected down, waiting for its lease to run out")
+                    continue
+                self.logger.warning(f"Primary {primary.name} of group {group} suspected down: phi {primary.phi(current_time):.1f} after {time_since_last_heartbeat:.1f}s without heartbeat")
+                candidate = self.cluster.takeover_candidate(current_time, failed=[primary.name], group=group)
+                if candidate == self.server_name:
+                    self._take_over_soon(group, primary)
+                else:
+                    self.logger.info(f"Waiting for higher-priority node {candidate} to take over group {group}")
             
-            time.sleep(self.check_heartbeat_interval)
+            await asyncio.sleep(self.check_heartbeat_interval)
             
-    def start(self):
-        """Start both heartbeat threads"""
-        self.sender_thread = threading.Thread(
-            target=self.send_heartbeat,
-            daemon=True
-        )
-        self.checker_thread = threading.Thread(
-            target=self.check_heartbeat,
-            daemon=True
-        )
-        self.sender_thread.start()
-        self.checker_thread.start()
+    def stats(self) -> dict:
+        """Heartbeat timing measurements: sender jitter, per-peer round-trip times and suspicion, UDP loss"""
+        stats = {
+            "roles": {group: monitor.role.value for group, monitor in self.monitors.items()},
+            "epochs": {group: monitor.epoch for group, monitor in self.monitors.items()},
+            "sender_jitter": self.sender_ticker.jitter_summary(),
+            "peers": self.cluster.stats(),
+        }
+        if self.disk_lease is not None:
+            stats["disk_lease"] = self.disk_lease.stats()
+        if self.udp_enabled:
+            stats["udp_sender_jitter"] = self.udp_ticker.jitter_summary()
+            if self.udp_receiver is not None:
+                stats["udp_receiver"] = {node: vars(s) for node, s in self.udp_receiver.stats.items()}
+        return stats
+
+    async def start(self):
+        """Start the heartbeat sender and checker as tasks on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [
+            asyncio.create_task(self.send_heartbeat()),
+            asyncio.create_task(self.check_heartbeat()),
+        ]
+        if self.disk_lease is not None:
+            self._tasks.append(asyncio.create_task(self.maintain_disk_leases()))
+        if self.udp_enabled:
+            secret = server_configs.udp_heartbeat_secret.encode()
+            self._udp_transport, self.udp_receiver = await start_udp_receiver(
+                server_configs.udp_heartbeat_port,
+                secret,
+                lambda node_id, packet: self.record_heartbeat(node_id),
+                self.logger,
+                max_age=server_configs.udp_heartbeat_max_age
+            )
+            self.udp_sender = UdpHeartbeatSender(
+                self.server_name,
+                [(urlparse(peer.url).hostname, server_configs.udp_heartbeat_port) for peer in self.cluster.peers.values()],
+                secret
+            )
+            await self.udp_sender.open()
+            self._tasks.append(asyncio.create_task(self.send_udp_heartbeat()))
         
     def stop(self):
-        """Stop the heartbeat threads"""
-        self._stop_event.set()
+        """Stop the heartbeat tasks, including sends and step-downs still in flight"""
+        for task in [*self._tasks, *self._sends, *self._step_downs, *self._takeovers.values()]:
+            task.cancel()
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self.udp_sender is not None:
+            self.udp_sender.close()
+
+def run_witness():
+    """Run this agent as the cluster's witness: no containers, only votes and lease grants"""
+    logger = setup_logger("witness")
+    witness = Witness(CLUSTER_PRIORITY, logger)
+    app = FastAPI()
+    
+    @app.post("/heartbeat")
+    async def receive_heartbeat(request: Dict[str, Any]):
+        server_name = request.get("server")
+        if server_name not in CLUSTER_PRIORITY:
+            raise HTTPException(status_code=403, detail="Unknown server")
+        return {
+            "message": "Heartbeat received",
+            "lease_grants": witness.record_heartbeat(server_name, request.get("roles", {}), request.get("epochs", {})),
+            "epochs": witness.epochs()
+        }
+    
+    @app.post("/vote")
+    async def vote(request: Dict[str, Any]):
+        server_name = request.get("server")
+        if server_name not in CLUSTER_PRIORITY:
+            raise HTTPException(status_code=403, detail="Unknown server")
+        granted, reason = witness.vote(server_name, request.get("group"), request.get("epoch", 0))
+        if not granted:
+            raise HTTPException(status_code=409, detail=reason)
+        return {"message": reason}
+    
+    @app.get("/heartbeat_stats")
+    async def heartbeat_stats():
+        return witness.stats()
+    
+    uvicorn.run(app, host="0.0.0.0", port=WITNESS_PORT)
 
 def main():
     parser = argparse.ArgumentParser(description='Container Monitor')
-    parser.add_argument('--server', 
+    role = parser.add_mutually_exclusive_group(required=True)
+    role.add_argument('--server', 
                        type=str,
-                       choices=['server1', 'server2'],
-                       required=True,
-                       help='Specify which server this is (server1 or server2)')
+                       choices=list(SERVER_CONFIGS),
+                       help='Specify which server this is')
+    role.add_argument('--witness',
+                       action='store_true',
+                       help='Run as the witness of the cluster, without containers')
     
     args = parser.parse_args()
     
-    # Select the appropriate configuration and initial role
-    if args.server == 'server1':
-        config = SERVER1_CONFIG
-        initial_role = ServerRole.PRIMARY
-    else:
-        config = SERVER2_CONFIG
-        initial_role = ServerRole.BACKUP
-    
-    # Initialize the monitor with shared failover lock
-    monitor = ContainerMonitor(
-        server_name=config.name,
-        other_server_url=config.endpoint,
-        initial_role=initial_role
+    if WITNESS_URL and not server_configs.lease_duration:
+        parser.error("lease_duration must be set when a witness is configured")
+    
+    if DISK_LEASE_PATH and not server_configs.lease_duration:
+        parser.error("lease_duration must be set when a disk lease is configured")
+    
+    if WITNESS_URL and DISK_LEASE_PATH:
+        parser.error("Configure either a witness or a disk lease, not both")
+    
+    if args.witness:
+        run_witness()
+        return
+    
+    # Select the appropriate configuration
+    config = SERVER_CONFIGS[args.server]
+    if config.name not in CLUSTER_PRIORITY:
+        parser.error(f"{config.name} is missing from CLUSTER_PRIORITY")
+    
+    peers = config.peers
+    if not peers:
+        # Two-node setup: the endpoint is the other server
+        others = [name for name in CLUSTER_PRIORITY if name != config.name]
+        if len(others) != 1:
+            parser.error(f"peers must be set for {config.name} in a cluster of more than two nodes")
+        peers = {others[0]: config.endpoint}
+    for name in peers:
+        if name not in CLUSTER_PRIORITY:
+            parser.error(f"Peer {name} is missing from CLUSTER_PRIORITY")
+    for group, priority in GROUP_PRIORITY.items():
+        if sorted(priority) != sorted(CLUSTER_PRIORITY):
+            parser.error(f"GROUP_PRIORITY of group {group} must list every node of CLUSTER_PRIORITY once")
+    cluster = Cluster(config.name, CLUSTER_PRIORITY, peers, GROUP_PRIORITY, WITNESS_URL)
+    
+    if server_configs.udp_heartbeat_enabled and not server_configs.udp_heartbeat_secret:
+        parser.error("udp_heartbeat_secret must be set when udp_heartbeat_enabled is true")
+    if server_configs.udp_heartbeat_enabled:
+        # Receivers would see a truncated name and drop every datagram as coming from an unknown node
+        for name in CLUSTER_PRIORITY:
+            if len(name.encode()) > MAX_NODE_ID_BYTES:
+                parser.error(f"Node name {name!r} is longer than the {MAX_NODE_ID_BYTES} bytes UDP heartbeats can carry")
+    
+    if server_configs.lease_duration and server_configs.lease_duration <= server_configs.heartbeat_interval:
+        parser.error("lease_duration must be longer than heartbeat_interval so a lease can be renewed")
+    
+    if server_configs.demotion_policy not in ("stop", "freeze"):
+        parser.error(f"Invalid demotion_policy {server_configs.demotion_policy!r}, expected 'stop' or 'freeze'")
+    
+    groups = config.groups or {"default": config.containers}
+    group_of = {}
+    for group, containers in groups.items():
+        for container_name in containers:
+            if container_name not in config.containers:
+                parser.error(f"Failover group {group} contains unknown container {container_name}")
+            if container_name in group_of:
+                parser.error(f"Container {container_name} is in both failover groups {group_of[container_name]} and {group}")
+            group_of[container_name] = group
+    ungrouped = [name for name in config.containers if name not in group_of]
+    if ungrouped:
+        parser.error(f"Containers not in any failover group: {', '.join(ungrouped)}")
+    for group in GROUP_PRIORITY:
+        if group not in groups:
+            parser.error(f"GROUP_PRIORITY configured for unknown failover group {group}")
+    
+    # Fail fast on a broken dependency graph instead of during a failover
+    try:
+        startup_tiers(config.containers, config.dependencies)
+    except ValueError as e:
+        parser.error(f"Invalid container dependencies: {str(e)}")
+    for container_name, deps in config.dependencies.items():
+        for dep in deps:
+            if group_of.get(dep) != group_of.get(container_name):
+                parser.error(f"Container {container_name} depends on {dep} from another failover group")
+    
+    for container_name, probe in config.readiness_probes.items():
+        if container_name not in config.containers:
+            parser.error(f"Readiness probe configured for unknown container {container_name}")
+        if probe.type not in PROBE_TYPES:
+            parser.error(f"Invalid readiness probe type {probe.type!r} for container {container_name}")
+    
+    logger = setup_logger(config.name)
+    docker_client = docker.from_env()
+    docker_executor = ThreadPoolExecutor(max_workers=server_configs.docker_workers, thread_name_prefix="docker")
+    
+    # One monitor per failover group, each with its own role and state machine.
+    # Each group starts out primary on its preferred node.
+    monitors = {
+        group: ContainerMonitor(
+            server_name=config.name,
+            cluster=cluster,
+            initial_role=ServerRole.PRIMARY if cluster.preferred_primary(group) == config.name else ServerRole.BACKUP,
+            dependencies={name: deps for name, deps in config.dependencies.items() if name in containers},
+            readiness_probes={name: probe for name, probe in config.readiness_probes.items() if name in containers},
+            unhealthy_thresholds={name: n for name, n in config.unhealthy_thresholds.items() if name in containers},
+            group=group,
+            containers=containers,
+            docker_client=docker_client,
+            docker_executor=docker_executor
+        )
+        for group, containers in groups.items()
+    }
+    
+    # Restore the roles and epochs this node had before it restarted
+    journal = None
+    if server_configs.journal_dir:
+        load_started_at = time.monotonic()
+        try:
+            journal = RoleJournal(server_configs.journal_dir, config.name, logger, server_configs.journal_snapshot_interval)
+            restored = journal.load()
+            for group, monitor in monitors.items():
+                if group in restored:
+                    role, epoch = restored[group]
+                    monitor.restore_role(ServerRole(role), epoch)
+                monitor.journal = journal
+                journal.record(group, monitor.role.value, monitor.epoch)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Can't use the role journal in {server_configs.journal_dir}: {str(e)}")
+        if restored:
+            logger.info(f"Restored roles from the journal in {(time.monotonic() - load_started_at) * 1000:.1f}ms")
+    
+    # Feed Docker events for our containers straight into the monitor of their group
+    event_watcher = ContainerEventWatcher(
+        docker_client,
+        config.containers,
+        lambda container_name, action: monitors[group_of[container_name]].handle_container_event(container_name, action),
+        logger
+    )
+    
+    # Checks in the background that the backup could actually take over
+    preflight_checker = PreflightChecker(
+        docker_client,
+        config.containers,
+        logger,
+        min_free_memory_mb=server_configs.preflight_min_free_memory_mb,
+        min_free_disk_mb=server_configs.preflight_min_free_disk_mb,
+        disk_path=server_configs.preflight_disk_path,
+        check_ports=server_configs.preflight_check_ports
     )
+    for monitor in monitors.values():
+        monitor.preflight = preflight_checker
+    
+    disk_lease = None
+    if DISK_LEASE_PATH:
+        try:
+            disk_lease = DiskLease(
+                DISK_LEASE_PATH,
+                config.name,
+                list(groups),
+                DISK_LEASE_SLOTS,
+                lease_duration=server_configs.lease_duration,
+                settle_delay=server_configs.heartbeat_interval,  # longer than a renewal's read-modify-write
+                logger=logger
+            )
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid disk lease: {str(e)}")
     
     # Initialize the heartbeat monitor
-    heartbeat = HeartbeatMonitor(monitor, config)
+    heartbeat = HeartbeatMonitor(monitors, cluster, logger, disk_lease)
+    
+    async def prepare_warm_standby(monitor):
+        async with heartbeat.failover_locks[monitor.group]:
+            if monitor.role == ServerRole.BACKUP:
+                await monitor.run_docker(monitor.prepare_warm_standby, monitor.containers)
+    
+    async def run_preflight_checks():
+        """Periodically verify that this node is ready to take over the groups it's the backup for"""
+        while True:
+            standby = [name for monitor in monitors.values() if monitor.role == ServerRole.BACKUP
+                       for name in monitor.containers]
+            if standby:
+                failed = await asyncio.get_running_loop().run_in_executor(
+                    docker_executor, preflight_checker.ensure, 0, standby)
+                for check in failed:
+                    logger.error(f"Standby not ready to take over, pre-flight check {check.name} failed: {check.detail}")
+            await asyncio.sleep(server_configs.preflight_interval)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Run the whole agent core as tasks on uvicorn's event loop"""
+        for monitor in monitors.values():
+            monitor.attach_event_loop(asyncio.get_running_loop())
+        await heartbeat.reconcile()
+        event_watcher.start()
+        monitoring_tasks = [asyncio.create_task(monitor_containers_wrapper(monitor)) for monitor in monitors.values()]
+        preflight_task = asyncio.create_task(run_preflight_checks())
+        await heartbeat.start()
+        warm_standby_tasks = []
+        if server_configs.warm_standby:
+            warm_standby_tasks = [asyncio.create_task(prepare_warm_standby(monitor)) for monitor in monitors.values()]
+        try:
+            yield
+        finally:
+            heartbeat.stop()
+            for task in monitoring_tasks:
+                task.cancel()
+            preflight_task.cancel()
+            for task in warm_standby_tasks:
+                task.cancel()
+            event_watcher.stop()
+            cluster.close()
+            if disk_lease is not None:
+                disk_lease.close()
+            if journal is not None:
+                journal.close()
     
     # Create FastAPI app
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     
     @app.post("/become_primary")
-    async def become_primary(request: Dict[str, str]):
+    async def become_primary(request: Dict[str, Any]):
         server_name = request.get("server")
         if not server_name:
             raise HTTPException(status_code=400, detail="Server name required")
+        if server_name not in cluster.peers:
+            raise HTTPException(status_code=403, detail="Unknown server")
+        monitor = monitors.get(request.get("group"))
+        if monitor is None:
+            raise HTTPException(status_code=404, detail="Unknown failover group")
         
-        with heartbeat._failover_lock:
-            if monitor.become_primary(config.containers):
-                return {"message": "Successfully transitioned to primary role"}
+        async with heartbeat.failover_locks[monitor.group]:
+            # Only the current primary can hand the group over, not a node fenced by a newer takeover
+            epoch = request.get("epoch", 0)
+            if epoch < monitor.epoch:
+                raise HTTPException(status_code=409, detail=f"Stale epoch {epoch}, group is at epoch {monitor.epoch}")
+            with FAILOVER_PHASE_SECONDS.labels(monitor.group, "promote").time():
+                promoted = await monitor.run_docker(monitor.become_primary, monitor.containers, epoch + 1)
+            if promoted:
+                return {
+                    "message": f"Successfully transitioned to primary role for group {monitor.group}",
+                    "startup_times": monitor.startup_times,
+                    "readiness_times": monitor.readiness_times
+                }
             else:
                 raise HTTPException(status_code=500, detail="Failed to transition to primary role")
     
     @app.post("/heartbeat")
-    async def receive_heartbeat(request: Dict[str, str]):
+    async def receive_heartbeat(request: Dict[str, Any]):
         server_name = request.get("server")
         if not server_name:
             raise HTTPException(status_code=400, detail="Server name required")
         
-        heartbeat.last_heartbeat = time.time()
-        monitor.logger.debug(f"Heartbeat received from {server_name}")
-        return {"message": "Heartbeat received"}
+        if server_name not in cluster.peers:
+            heartbeat.record_heartbeat(server_name)  # logs the unknown node
+            raise HTTPException(status_code=403, detail="Unknown server")
+        roles, lease_grants = heartbeat.check_epochs(server_name, request.get("roles", {}), request.get("epochs", {}))
+        heartbeat.record_heartbeat(server_name, roles)
+        return {
+            "message": "Heartbeat received",
+            "epochs": {group: monitor.epoch for group, monitor in monitors.items()},
+            "lease_grants": lease_grants,
+            "digest_versions": {
+                group: heartbeat.receive_digest(server_name, group, payload)
+                for group, payload in request.get("digests", {}).items() if group in monitors
+            }
+        }
+    
+    @app.get("/preflight")
+    async def preflight():
+        return preflight_checker.as_dict()
+    
+    @app.get("/heartbeat_stats")
+    async def heartbeat_stats():
+        return heartbeat.stats()
+    
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        for group, monitor in monitors.items():
+            ROLE.labels(group).set(1 if monitor.role == ServerRole.PRIMARY else 0)
+            EPOCH.labels(group).set(monitor.epoch)
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
     
     # Modified monitor_containers_wrapper to use the failover lock
-    def monitor_containers_wrapper():
-        """Wrapper function to handle container monitoring with proper locking"""
+    async def monitor_containers_wrapper(monitor):
+        """
+        Wrapper coroutine to handle container monitoring of one failover group with proper locking.
+        Runs a check as soon as a Docker event arrives for one of the group's containers or a
+        scheduled verification check is due, and falls back to a full reconciliation
+        every reconcile_interval seconds. Docker calls run on the monitor's worker pool
+        so heartbeats, the API and the other groups keep being served during a failover.
+        """
+        lock = heartbeat.failover_locks[monitor.group]
         while True:
-            if monitor.role == ServerRole.PRIMARY:
-                for container_name in config.containers:
-                    if not monitor.should_check_container(container_name):
-                        continue
-                        
-                    if not monitor.get_container_status(container_name):
-                        monitor.logger.warning(f"Container {container_name} appears to be down, verifying...")
-                        
-                        if not monitor.verify_container_health(container_name):
-                            monitor.logger.warning(f"Container {container_name} confirmed down!")
+            if monitor.lease_expired():
+                monitor.logger.error("Lease expired without renewal from a quorum, stepping down")
+                await heartbeat.step_down(monitor.group)
+            elif monitor.role == ServerRole.PRIMARY:
+                # Advances every container's verification without blocking on any of them
+                confirmed_down = await monitor.run_docker(monitor.check_containers, monitor.containers)
+                if confirmed_down:
+                    monitor.logger.warning(f"Containers confirmed down: {', '.join(confirmed_down)}")
+                    
+                    async with lock:
+                        # A takeover, hand-over or promotion may have run while we waited for the lock
+                        confirmed_down = monitor.confirmed_down(confirmed_down)
+                        if monitor.role != ServerRole.PRIMARY or not confirmed_down:
+                            monitor.logger.info("Containers no longer confirmed down, not failing over")
+                        else:
+                            with FAILOVER_PHASE_SECONDS.labels(monitor.group, "release").time():
+                                stop_results = await monitor.run_docker(monitor.release_containers, monitor.containers, confirmed_down)
+                            if all(stop_results.values()):
+                                monitor.logger.info("All containers released successfully")
                             
-                            with heartbeat._failover_lock:
-                                if monitor.stop_all_containers(config.containers):
-                                    monitor.logger.info("All containers stopped successfully")
-                                    
-                                    if monitor.notify_other_server():
-                                        monitor.logger.info("Other server notified successfully")
-                                        monitor.become_backup(config.containers)
-                                    else:
-                                        monitor.logger.error("Failed to notify other server")
+                                with FAILOVER_PHASE_SECONDS.labels(monitor.group, "handover").time():
+                                    handed_over = await asyncio.to_thread(monitor.notify_other_server)
+                                if handed_over:
+                                    monitor.logger.info("Other server notified successfully")
+                                    FAILOVERS_TOTAL.labels(monitor.group, "handover").inc()
+                                    # The containers were already released before handing over
+                                    await monitor.run_docker(monitor.become_backup, monitor.containers, False)
                                 else:
-                                    monitor.logger.error("Failed to stop all containers")
+                                    monitor.logger.error("Failed to notify other server")
+                            else:
+                                monitor.logger.error("Failed to release all containers")
+            elif monitor.freeze_expired():
+                async with lock:
+                    await monitor.run_docker(monitor.expire_frozen_containers, monitor.containers)
             
-            time.sleep(10)
-    
-    # Start monitoring in a separate thread with the wrapper
-    monitoring_thread = threading.Thread(
-        target=monitor_containers_wrapper,
-        daemon=True
-    )
-    monitoring_thread.start()
-    
-    # Start the heartbeat monitoring
-    heartbeat.start()
+            await monitor.wait_for_events_async(monitor.next_check_delay(server_configs.reconcile_interval))
     
     # Start the API server
-    try:
-        uvicorn.run(app, host="0.0.0.0", port=config.port)
-    finally:
-        heartbeat.stop()
+    uvicorn.run(app, host="0.0.0.0", port=config.port)
 
 if __name__ == "__main__":
     main()
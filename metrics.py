@@ -0,0 +1,225 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds, from sub-millisecond Docker and heartbeat calls up to slow failovers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _ShardedValues:
+    """
+    Per-thread arrays of numbers that are summed up when read. Each recording
+    thread only ever writes to its own shard, so recording takes no lock; the
+    lock is only taken the first time a thread records and when scraping.
+    Shards of threads that have exited are folded into a single retired shard,
+    since the short-lived container worker pools would otherwise pile them up.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self._shards: List[Tuple[threading.Thread, List[float]]] = []
+        self._retired = [0.0] * size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def shard(self) -> List[float]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0.0] * self.size
+            self._local.shard = shard
+            with self._lock:
+                self._retire_exited()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_exited(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for i, value in enumerate(shard):
+                    self._retired[i] += value
+        self._shards = alive
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            self._retire_exited()
+            shards = [self._retired] + [shard for _, shard in self._shards]
+        return [sum(shard[i] for shard in shards) for i in range(self.size)]
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child for one combination of label values, created on first use"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, key: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount: float = 1):
+        self._values.shard()[0] += amount
+
+    def get(self) -> float:
+        return self._values.totals()[0]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _samples(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {child.get()}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0  # a single assignment, atomic under the GIL
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def _samples(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self._values = _ShardedValues(len(buckets) + 3)  # one per bucket, +Inf, sum, count
+
+    def observe(self, value: float):
+        shard = self._values.shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    @contextmanager
+    def time(self):
+        """Observe the monotonic duration of the with block"""
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start_time)
+
+    def totals(self) -> List[float]:
+        return self._values.totals()
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _samples(self, key, child) -> List[str]:
+        totals = child.totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += int(count)
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {totals[-2]}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(totals[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DOCKER_API_SECONDS = REGISTRY.register(Histogram(
+    "failover_docker_api_seconds", "Latency of Docker API calls", ["operation"]))
+HEARTBEAT_RTT_SECONDS = REGISTRY.register(Histogram(
+    "failover_heartbeat_rtt_seconds", "Round-trip time of HTTP heartbeats", ["peer"]))
+HEARTBEAT_INTERARRIVAL_SECONDS = REGISTRY.register(Histogram(
+    "failover_heartbeat_interarrival_seconds", "Time between heartbeats received from a peer", ["peer"]))
+VERIFICATION_SECONDS = REGISTRY.register(Histogram(
+    "failover_verification_seconds", "Time from a container going down until it was confirmed down or recovered",
+    ["group", "outcome"]))
+FAILOVER_PHASE_SECONDS = REGISTRY.register(Histogram(
+    "failover_phase_seconds", "Duration of each phase of a failover", ["group", "phase"]))
+
+FAILOVERS_TOTAL = REGISTRY.register(Counter(
+    "failover_failovers_total", "Role transitions of failover groups", ["group", "kind"]))
+CONTAINER_ACTION_ERRORS_TOTAL = REGISTRY.register(Counter(
+    "failover_container_action_errors_total", "Containers whose stop, start, pause, unpause or readiness probe failed or timed out", ["action"]))
+HEARTBEAT_SEND_FAILURES_TOTAL = REGISTRY.register(Counter(
+    "failover_heartbeat_send_failures_total", "Heartbeats that couldn't be delivered", ["peer", "reason"]))
+
+ROLE = REGISTRY.register(Gauge(
+    "failover_role", "1 if this node is primary for the group, 0 if backup", ["group"]))
+EPOCH = REGISTRY.register(Gauge(
+    "failover_epoch", "Fencing epoch of the group as known to this node", ["group"]))
+CONTAINER_UP = REGISTRY.register(Gauge(
+    "failover_container_up", "1 if the container was up at the last check, 0 if down", ["group", "container"]))
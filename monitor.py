@@ -1,46 +1,292 @@
 import docker
-import requests
+import asyncio
+import functools
+import threading
 import time
 import logging
-from typing import List, Dict
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional
 from dataclasses import dataclass
 from enum import Enum
 from collections import defaultdict
-from config import GENERAL_CONFIG
+from config import GENERAL_CONFIG, ServerConfig, ReadinessProbe
+from digest import ContainerStateDigest
+from probes import run_probe
+from metrics import DOCKER_API_SECONDS, CONTAINER_ACTION_ERRORS_TOTAL, VERIFICATION_SECONDS, FAILOVER_PHASE_SECONDS, CONTAINER_UP
 
 server_configs = GENERAL_CONFIG
 
+# Health as reported in the Status column of /containers/json, e.g. "Up 5 seconds (healthy)"
+HEALTH_STATUS_PATTERN = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+
 class ServerRole(Enum):
     PRIMARY = "primary"
     BACKUP = "backup"
 
+class VerificationState(Enum):
+    SUSPECT = "suspect"            # seen down, waiting out the restart grace period
+    CONFIRMING = "confirming"      # grace period over, taking consecutive checks
+    CONFIRMED_DOWN = "confirmed_down"
+    RECOVERED = "recovered"
+
 @dataclass
-class ServerConfig:
-    name: str
-    containers: List[str]
-    endpoint: str
-    port: int
+class ContainerVerification:
+    state: VerificationState
+    down_since: float
+    next_check_at: float
+    failed_checks: int = 0
+
+def startup_tiers(containers: List[str], dependencies: Dict[str, List[str]]) -> List[List[str]]:
+    """
+    Split containers into startup tiers so that every container comes after all
+    of its dependencies. Containers within a tier don't depend on each other.
+    Raises ValueError for unknown dependencies or dependency cycles.
+    """
+    for container_name, needs in dependencies.items():
+        for dependency in [container_name] + list(needs):
+            if dependency not in containers:
+                raise ValueError(f"Dependency {dependency} of {container_name} is not a configured container")
+
+    remaining = list(containers)
+    placed = set()
+    tiers = []
+    while remaining:
+        tier = [name for name in remaining if all(dep in placed for dep in dependencies.get(name, []))]
+        if not tier:
+            raise ValueError(f"Dependency cycle between containers: {', '.join(remaining)}")
+        tiers.append(tier)
+        placed.update(tier)
+        remaining = [name for name in remaining if name not in placed]
+    return tiers
+
+def setup_logger(server_name: str) -> logging.Logger:
+    """The agent's logger, shared by the monitors of all failover groups"""
+    logger = logging.getLogger(f'container_monitor_{server_name}')
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler()
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
 
 class ContainerMonitor:
-    def __init__(self, server_name: str, other_server_url: str, initial_role: ServerRole):
+    """
+    Monitors one failover group: a set of containers that fail over together,
+    with its own role, verification state machine and state digest.
+    """
+    def __init__(self, server_name: str, cluster, initial_role: ServerRole,
+                 dependencies: Optional[Dict[str, List[str]]] = None,
+                 readiness_probes: Optional[Dict[str, ReadinessProbe]] = None,
+                 unhealthy_thresholds: Optional[Dict[str, int]] = None,
+                 group: str = "default", containers: Optional[List[str]] = None,
+                 docker_client=None, docker_executor=None):
         self.server_name = server_name
-        self.other_server_url = other_server_url
+        self.group = group
+        self.containers = containers or []  # The containers of this failover group
+        self.cluster = cluster  # The other nodes, in takeover priority order
         self.role = initial_role
-        self.docker_client = docker.from_env()
+        self.epoch = 0  # Fencing epoch of the group, bumped on every takeover
+        self.lease_duration = server_configs.lease_duration  # seconds a lease lasts unless renewed, 0 disables leases
+        # A node that starts as primary gets one lease period to have it renewed by a quorum
+        self.lease_expires_at: Optional[float] = time.monotonic() + self.lease_duration if initial_role == ServerRole.PRIMARY else None
+        self.dependencies = dependencies or {}  # container -> containers that must be ready first
+        self.readiness_probes = readiness_probes or {}  # container -> probe that must pass before it counts as ready
+        self.unhealthy_thresholds = unhealthy_thresholds or {}  # container -> unhealthy transitions that count as down
+        self.unhealthy_threshold = server_configs.unhealthy_threshold  # default for containers without their own policy
+        self.unhealthy_transitions = defaultdict(int)  # Times each container turned unhealthy since it was started
+        self._last_health = {}
+        self._health_lock = threading.Lock()
+        # Groups share the Docker client and worker pool
+        self.docker_client = docker_client or docker.from_env()
+        self.docker_executor = docker_executor or ThreadPoolExecutor(max_workers=server_configs.docker_workers, thread_name_prefix="docker")
         self.logger = self._setup_logger()
         self.startup_grace_period = server_configs.startup_grace_period  # grace period for initial startup
         self.restart_grace_period = server_configs.restart_grace_period  # grace period for container restarts (in seconds)
-        self.container_start_time = 0
+        self.stop_workers = server_configs.stop_workers  # max containers stopped in parallel
+        self.stop_timeout = server_configs.stop_timeout  # seconds allowed for each container to stop
+        self.start_workers = server_configs.start_workers  # max containers started in parallel
+        self.start_timeout = server_configs.start_timeout  # seconds allowed for each container start call
+        self.warm_standby = server_configs.warm_standby  # keep containers started but paused while backup
+        self.demotion_policy = server_configs.demotion_policy  # 'stop' or 'freeze' containers when demoted
+        self.freeze_retention = server_configs.freeze_retention  # seconds frozen containers are kept for a failback
+        self.frozen_until: Optional[float] = None  # monotonic time at which frozen containers get stopped
+        self.verification_checks = server_configs.verification_checks  # consecutive failed checks before a container counts as down
+        self.verification_interval = server_configs.verification_interval  # seconds between those checks
+        self.container_start_time: Optional[float] = None  # monotonic time of our last container start
+        self.starting = False  # True while start_all_containers runs; containers aren't verified meanwhile
+        self.verifications: Dict[str, ContainerVerification] = {}  # Containers currently being verified
         self.container_down_times = defaultdict(float)  # Tracks when containers first went down
+        self.startup_poll_interval = server_configs.startup_poll_interval  # first poll delay while waiting for startup
+        self.startup_poll_max_interval = server_configs.startup_poll_max_interval  # poll delay backs off up to this
+        self.startup_times = {}  # Seconds each container took to become ready during the last startup
+        self.readiness_timeout = server_configs.readiness_timeout  # seconds a readiness probe may take to pass
+        self.readiness_initial_backoff = server_configs.readiness_initial_backoff
+        self.readiness_max_backoff = server_configs.readiness_max_backoff
+        self.readiness_times = {}  # Seconds from the start of the last startup until each probe passed
+        self.startup_started_at: Optional[float] = None
+        self._event_condition = threading.Condition()
+        self._event_sequence = 0  # Bumped on every Docker event so waiters can tell something happened
+        self._waited_sequence = 0  # _event_sequence when wait_for_events last returned
+        self._event_loop = None
+        self._async_event_wakeup = None
+        self.snapshot = None  # Container summaries from the last list call, keyed by name
+        self.snapshot_containers = []
+        self.state_digest = ContainerStateDigest()  # Sent to the backup with every heartbeat
+        self.journal = None  # Optional RoleJournal that records every role transition
+        self.preflight = None  # Optional PreflightChecker whose cached results promotion can rely on
+        self.preflight_max_age = 2 * server_configs.preflight_interval  # seconds a passed pre-flight check stays valid
         
     def _setup_logger(self) -> logging.Logger:
-        logger = logging.getLogger(f'container_monitor_{self.server_name}')
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        return logger
+        return setup_logger(self.server_name).getChild(self.group)
+
+    def attach_event_loop(self, loop: asyncio.AbstractEventLoop):
+        """Let Docker events wake up coroutines waiting in wait_for_events_async on this loop"""
+        self._event_loop = loop
+        self._async_event_wakeup = asyncio.Event()
+
+    async def run_docker(self, func, *args):
+        """
+        Run a blocking docker-py based call on the Docker worker pool, so the
+        asyncio agent core can await it without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.docker_executor, functools.partial(func, *args))
+
+    def handle_container_event(self, container_name: str, action: str):
+        """
+        Called by the Docker events watcher. Records the event and wakes up
+        the monitoring loop and any startup waiters so the container is checked straight away.
+        """
+        if self.role == ServerRole.PRIMARY:
+            self.logger.info(f"Docker event '{action}' received for container {container_name}")
+        else:
+            self.logger.debug(f"Docker event '{action}' received for container {container_name}")
+        if action == "start":
+            self._reset_health(container_name)
+        elif action.startswith("health_status"):
+            self._record_health(container_name, action.split(":", 1)[-1].strip())
+        with self._event_condition:
+            self._event_sequence += 1
+            self._event_condition.notify_all()
+        if self._event_loop is not None:
+            self._event_loop.call_soon_threadsafe(self._async_event_wakeup.set)
+
+    def wait_for_events(self, timeout: float):
+        """
+        Block until a Docker event arrives or the timeout expires.
+        Returns straight away if an event arrived since the previous call.
+        """
+        with self._event_condition:
+            self._event_condition.wait_for(lambda: self._event_sequence != self._waited_sequence, timeout)
+            self._waited_sequence = self._event_sequence
+
+    async def wait_for_events_async(self, timeout: float):
+        """Coroutine version of wait_for_events, requires attach_event_loop"""
+        try:
+            await asyncio.wait_for(self._async_event_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_event_wakeup.clear()
+
+    def _wait_for_event_after(self, sequence: int, timeout: float):
+        """Block until any Docker event newer than sequence arrives or the timeout expires"""
+        with self._event_condition:
+            self._event_condition.wait_for(lambda: self._event_sequence != sequence, timeout)
+
+    def refresh_snapshot(self, containers: Optional[List[str]] = None) -> bool:
+        """
+        Take a snapshot of the given containers with a single filtered list call.
+        Status queries are served from this snapshot until the next refresh,
+        so a monitoring cycle costs one Docker API request whatever the group size.
+        """
+        if containers is not None:
+            self.snapshot_containers = list(containers)
+        try:
+            with DOCKER_API_SECONDS.labels("list").time():
+                summaries = self.docker_client.api.containers(
+                    all=True,
+                    filters={"name": [f"^/{name}$" for name in self.snapshot_containers]}
+                )
+        except Exception as e:
+            self.logger.error(f"Error listing containers: {str(e)}")
+            self.snapshot = None
+            return False
+
+        snapshot = {}
+        for summary in summaries:
+            for name in summary.get("Names") or []:
+                name = name.lstrip("/")
+                if name in self.snapshot_containers:
+                    snapshot[name] = summary
+        self.snapshot = snapshot
+        return True
+
+    def invalidate_snapshot(self):
+        """Drop the snapshot after we changed container state ourselves"""
+        self.snapshot = None
+
+    def _get_container_state(self, container_name: str) -> Optional[str]:
+        """
+        Returns the container state ('running', 'exited', ...) or None if the container doesn't exist.
+        Served from the snapshot when one is available, otherwise inspects the container directly.
+        """
+        if self.snapshot is not None and container_name in self.snapshot_containers:
+            summary = self.snapshot.get(container_name)
+            return summary.get("State") if summary else None
+        try:
+            return self.docker_client.containers.get(container_name).status
+        except docker.errors.NotFound:
+            return None
+
+    def update_state_digest(self, containers: List[str]):
+        """
+        Bring the state digest up to date from the current snapshot.
+        Restart counts aren't part of the list call, so a container is only
+        inspected when its state changed since the last update.
+        """
+        if self.snapshot is None:
+            return
+        for container_name in containers:
+            summary = self.snapshot.get(container_name)
+            state = summary.get("State") if summary else "missing"
+            previous = self.state_digest.containers.get(container_name)
+            if previous is not None and previous[0] == state:
+                continue
+            restart_count = previous[1] if previous is not None else 0
+            if summary:
+                try:
+                    with DOCKER_API_SECONDS.labels("inspect").time():
+                        restart_count = self.docker_client.api.inspect_container(container_name).get("RestartCount", 0)
+                except Exception as e:
+                    self.logger.error(f"Error inspecting container {container_name}: {str(e)}")
+            self.state_digest.update(container_name, state, restart_count)
+
+    def _get_container_health(self, container_name: str) -> Optional[str]:
+        """
+        Returns 'healthy', 'unhealthy' or 'starting' for containers with a HEALTHCHECK,
+        None for containers without one or that don't exist.
+        """
+        if self.snapshot is not None and container_name in self.snapshot_containers:
+            summary = self.snapshot.get(container_name)
+            match = HEALTH_STATUS_PATTERN.search(summary.get("Status") or "") if summary else None
+            return match.group(1).replace("health: ", "") if match else None
+        try:
+            container = self.docker_client.containers.get(container_name)
+        except docker.errors.NotFound:
+            return None
+        return container.attrs.get("State", {}).get("Health", {}).get("Status")
+
+    def _is_container_ready(self, container_name: str) -> bool:
+        """A container is ready once it's running, and healthy if it defines a HEALTHCHECK"""
+        try:
+            if self._get_container_state(container_name) != 'running':
+                return False
+            return self._get_container_health(container_name) in (None, 'healthy')
+        except Exception as e:
+            self.logger.error(f"Error checking container {container_name}: {str(e)}")
+            return False
 
     def should_check_container(self, container_name: str) -> bool:
         """
@@ -48,28 +294,62 @@ class ContainerMonitor:
         and other conditions.
         """
         # Skip checks during initial startup grace period
-        time_since_start = time.time() - self.container_start_time
-        if time_since_start < self.startup_grace_period:
-            self.logger.debug(f"In startup grace period for {container_name}, {int(self.startup_grace_period - time_since_start)}s remaining")
-            return False
+        if self.container_start_time is not None:
+            time_since_start = time.monotonic() - self.container_start_time
+            if time_since_start < self.startup_grace_period:
+                self.logger.debug(f"In startup grace period for {container_name}, {int(self.startup_grace_period - time_since_start)}s remaining")
+                return False
             
         try:
             # Make sure container exists before checking
-            self.docker_client.containers.get(container_name)
+            if self._get_container_state(container_name) is None:
+                self.logger.error(f"Container {container_name} not found")
+                return False
             return True
-        except docker.errors.NotFound:
-            self.logger.error(f"Container {container_name} not found")
-            return False
         except Exception as e:
             self.logger.error(f"Error accessing container {container_name}: {str(e)}")
             return False
 
 
 
+    def _record_health(self, container_name: str, health: Optional[str]):
+        """Count transitions into unhealthy, whether seen as an event or in a snapshot"""
+        with self._health_lock:
+            if health == 'unhealthy' and self._last_health.get(container_name) != 'unhealthy':
+                self.unhealthy_transitions[container_name] += 1
+                self.logger.warning(f"Container {container_name} turned unhealthy "
+                                    f"({self.unhealthy_transitions[container_name]} time(s) since it was started)")
+            self._last_health[container_name] = health
+
+    def _reset_health(self, container_name: str):
+        with self._health_lock:
+            self.unhealthy_transitions.pop(container_name, None)
+            self._last_health.pop(container_name, None)
+
+    def _is_unhealthy_down(self, container_name: str) -> bool:
+        """
+        Whether a running container counts as down because of its HEALTHCHECK:
+        it's unhealthy right now and turned unhealthy at least as many times as its policy allows.
+        """
+        health = self._get_container_health(container_name)
+        self._record_health(container_name, health)
+        threshold = self.unhealthy_thresholds.get(container_name, self.unhealthy_threshold)
+        return health == 'unhealthy' and self.unhealthy_transitions[container_name] >= threshold
+
     def get_container_status(self, container_name: str) -> bool:
+        """
+        Returns True if the container is up: running, and not unhealthy according
+        to its HEALTHCHECK and unhealthy policy.
+        """
         try:
-            container = self.docker_client.containers.get(container_name)
-            is_running = container.status == 'running'
+            state = self._get_container_state(container_name)
+            if state is None:
+                self.logger.error(f"Container {container_name} not found")
+                return False
+            is_running = state == 'running'
+            if is_running and self._is_unhealthy_down(container_name):
+                self.logger.debug(f"Container {container_name} is running but unhealthy")
+                is_running = False
             
             # If container is running, reset its down time
             if is_running:
@@ -80,120 +360,417 @@ class ContainerMonitor:
                 # If container just went down, record the time
                 if container_name not in self.container_down_times:
                     self.logger.warning(f"Container {container_name} appears to be down, starting grace period")
-                    self.container_down_times[container_name] = time.time()
+                    self.container_down_times[container_name] = time.monotonic()
                     
             return is_running
-        except docker.errors.NotFound:
-            self.logger.error(f"Container {container_name} not found")
-            return False
         except Exception as e:
             self.logger.error(f"Error checking container {container_name}: {str(e)}")
             return False
 
     def wait_for_containers_startup(self, containers: List[str], timeout: int = 300) -> bool:
         """
-        Wait for all containers to be in running state with a timeout.
-        Returns True if all containers are running, False if timeout is reached.
+        Wait for all containers to be running (and healthy, if they define a HEALTHCHECK) with a timeout.
+        Containers are re-checked as soon as a Docker event arrives, otherwise with a short
+        poll that backs off from startup_poll_interval up to startup_poll_max_interval.
+        Time-to-ready for each container is recorded in startup_times.
+        Returns True if all containers are ready, False if timeout is reached.
         """
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            all_running = True
-            for container_name in containers:
-                if not self.get_container_status(container_name):
-                    all_running = False
-                    break
-            
-            if all_running:
+        start_time = time.monotonic()
+        pending = list(containers)
+        poll_interval = self.startup_poll_interval
+        while True:
+            sequence = self._event_sequence
+            self.refresh_snapshot(pending)
+            for container_name in list(pending):
+                if self._is_container_ready(container_name):
+                    self.startup_times[container_name] = time.monotonic() - start_time
+                    self.container_down_times.pop(container_name, None)
+                    pending.remove(container_name)
+                    self.logger.info(f"Container {container_name} is running after {self.startup_times[container_name]:.2f}s")
+
+            if not pending:
                 self.logger.info("All containers are now running")
                 return True
-                
-            self.logger.info("Waiting for containers to start...")
-            time.sleep(10)
-            
-        self.logger.error(f"Timeout reached while waiting for containers to start")
+
+            remaining = timeout - (time.monotonic() - start_time)
+            if remaining <= 0:
+                break
+
+            self.logger.debug(f"Waiting for containers to start: {', '.join(pending)}")
+            self._wait_for_event_after(sequence, min(poll_interval, remaining))
+            poll_interval = min(poll_interval * 2, self.startup_poll_max_interval)
+
+        self.logger.error(f"Timeout reached while waiting for containers to start: {', '.join(pending)}")
         return False
 
-    def stop_all_containers(self, containers: List[str]) -> bool:
-        try:
-            for container_name in containers:
-                container = self.docker_client.containers.get(container_name)
-                container.stop(timeout=0)  # Equivalent to docker stop -t 0
-                self.logger.info(f"Stopped container: {container_name}")
-            return True
-        except Exception as e:
-            self.logger.error(f"Error stopping containers: {str(e)}")
-            return False
+    def _run_parallel(self, action, containers: List[str], workers: int, timeout: float, verb: str) -> Dict[str, bool]:
+        """
+        Run action(container_name) for every container on a bounded worker pool.
+        Each container gets its own deadline; containers queued behind a full pool
+        get one extra timeout per wave ahead of them.
+        Returns a map of container name to whether the action succeeded in time.
+        """
+        results = {}
+        if not containers:
+            return results
+
+        workers = max(1, min(workers, len(containers)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"container_{verb}")
+        start_time = time.monotonic()
+        futures = {name: executor.submit(action, name) for name in containers}
+        for index, (container_name, future) in enumerate(futures.items()):
+            deadline = start_time + timeout * (index // workers + 1)
+            try:
+                results[container_name] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                self.logger.error(f"Timed out trying to {verb} container {container_name}")
+                results[container_name] = False
+            except Exception as e:
+                self.logger.error(f"Error trying to {verb} container {container_name}: {str(e)}")
+                results[container_name] = False
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        failed = [name for name, succeeded in results.items() if not succeeded]
+        if failed:
+            CONTAINER_ACTION_ERRORS_TOTAL.labels(verb).inc(len(failed))
+            self.logger.error(f"Failed to {verb} containers: {', '.join(failed)}")
+        return results
+
+    def _stop_container(self, container_name: str) -> bool:
+        with DOCKER_API_SECONDS.labels("stop").time():
+            container = self.docker_client.containers.get(container_name)
+            container.stop(timeout=0)  # Equivalent to docker stop -t 0
+        self.logger.info(f"Stopped container: {container_name}")
+        return True
+
+    def _start_container(self, container_name: str) -> bool:
+        with DOCKER_API_SECONDS.labels("start").time():
+            container = self.docker_client.containers.get(container_name)
+            container.start()
+        self.logger.info(f"Started container: {container_name}")
+        return True
+
+    def _pause_container(self, container_name: str) -> bool:
+        with DOCKER_API_SECONDS.labels("pause").time():
+            container = self.docker_client.containers.get(container_name)
+            if container.status == 'running':
+                container.pause()
+                self.logger.info(f"Paused container: {container_name}")
+        return True
+
+    def _unpause_container(self, container_name: str) -> bool:
+        with DOCKER_API_SECONDS.labels("unpause").time():
+            container = self.docker_client.containers.get(container_name)
+            container.unpause()
+        self.logger.info(f"Unpaused container: {container_name}")
+        return True
+
+    def stop_all_containers(self, containers: List[str]) -> Dict[str, bool]:
+        """
+        Stop all containers in parallel on a bounded worker pool.
+        A failing or hanging container doesn't prevent the others from being stopped.
+        Returns a map of container name to whether it was stopped within its deadline.
+        """
+        self.invalidate_snapshot()
+        return self._run_parallel(self._stop_container, containers, self.stop_workers, self.stop_timeout, "stop")
+
+    def release_containers(self, containers: List[str], failed: List[str] = ()) -> Dict[str, bool]:
+        """
+        Release the containers when giving up the primary role, following the demotion policy.
+        'stop' stops all of them. 'freeze' pauses the healthy ones for freeze_retention seconds,
+        so a failback within that window only has to unpause them, and stops the failed ones
+        so they get a fresh start. Containers that can't be paused are stopped instead.
+        Returns a map of container name to whether it was released.
+        """
+        if self.demotion_policy != 'freeze':
+            return self.stop_all_containers(containers)
+
+        self.invalidate_snapshot()
+        healthy = [name for name in containers if name not in failed]
+        results = self.stop_all_containers([name for name in containers if name in failed])
+        paused = self._run_parallel(self._pause_container, healthy, self.stop_workers, self.stop_timeout, "pause")
+        results.update(paused)
+        unpausable = [name for name, succeeded in paused.items() if not succeeded]
+        if unpausable:
+            results.update(self.stop_all_containers(unpausable))
+
+        self.frozen_until = time.monotonic() + self.freeze_retention
+        self.logger.info(f"Containers frozen for {self.freeze_retention}s in case of a failback")
+        return results
+
+    def freeze_expired(self) -> bool:
+        return self.frozen_until is not None and time.monotonic() >= self.frozen_until
+
+    def expire_frozen_containers(self, containers: List[str]):
+        """Stop containers frozen at demotion once the retention window is over"""
+        self.frozen_until = None
+        if self.role != ServerRole.BACKUP or self.warm_standby:
+            # Promoted again in time, or paused containers are exactly what warm standby wants
+            return
+        self.logger.info("Freeze retention window is over, stopping frozen containers")
+        self.stop_all_containers(containers)
+
+    def _wait_until_probe_passes(self, container_name: str) -> bool:
+        """Retry the container's readiness probe with exponential backoff until it passes or times out"""
+        probe = self.readiness_probes[container_name]
+        deadline = time.monotonic() + self.readiness_timeout
+        backoff = self.readiness_initial_backoff
+        while not run_probe(probe, container_name, self.docker_client, self.logger):
+            if time.monotonic() + backoff >= deadline:
+                self.logger.error(f"Readiness probe for container {container_name} didn't pass within {self.readiness_timeout}s")
+                return False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.readiness_max_backoff)
+        self.readiness_times[container_name] = time.monotonic() - self.startup_started_at
+        self.logger.info(f"Container {container_name} is ready after {self.readiness_times[container_name]:.2f}s")
+        return True
+
+    def wait_for_readiness(self, containers: List[str]) -> bool:
+        """Run the readiness probes of the given containers concurrently, True once all of them passed"""
+        probed = [name for name in containers if name in self.readiness_probes]
+        results = self._run_parallel(self._wait_until_probe_passes, probed, len(probed), self.readiness_timeout, "probe")
+        return all(results.values())
 
     def start_all_containers(self, containers: List[str]) -> bool:
+        """
+        Start containers tier by tier following the configured dependencies.
+        Every tier is started in parallel and the next tier starts as soon as
+        the previous one is running and its readiness probes pass, so promotion
+        time follows the critical path.
+        """
+        self.invalidate_snapshot()
+        self.startup_times = {}
+        self.readiness_times = {}
+        self.startup_started_at = time.monotonic()
+        # Dependencies outside the given containers are already up
+        dependencies = {name: [dep for dep in self.dependencies.get(name, []) if dep in containers]
+                        for name in containers}
         try:
-            for container_name in containers:
-                container = self.docker_client.containers.get(container_name)
-                container.start()
-                self.logger.info(f"Started container: {container_name}")
-            
-            self.container_start_time = time.time()
-            # Wait for containers to actually start
-            if self.wait_for_containers_startup(containers):
-                return True
-            return False
-        except Exception as e:
-            self.logger.error(f"Error starting containers: {str(e)}")
+            tiers = startup_tiers(containers, dependencies)
+        except ValueError as e:
+            self.logger.error(f"Invalid container dependencies: {str(e)}")
             return False
 
-    def notify_other_server(self) -> bool:
+        # Later tiers are still stopped while earlier ones become ready, which mustn't count as a failure
+        self.starting = True
         try:
-            response = requests.post(
-                f"{self.other_server_url}/become_primary",
-                json={"server": self.server_name}
-            )
-            return response.status_code == 200
-        except Exception as e:
-            self.logger.error(f"Error notifying other server: {str(e)}")
+            for tier in tiers:
+                results = self._run_parallel(self._start_container, tier, self.start_workers, self.start_timeout, "start")
+                self.container_start_time = time.monotonic()
+                if not all(results.values()):
+                    return False
+                # Wait for this tier to actually serve before starting the containers that depend on it
+                if not self.wait_for_containers_startup(tier):
+                    return False
+                if not self.wait_for_readiness(tier):
+                    return False
+            return True
+        finally:
+            # The startup grace period runs from the end of the whole startup
+            self.container_start_time = time.monotonic()
+            self.verifications.clear()
+            self.starting = False
+
+    def resume_paused_containers(self, containers: List[str]) -> Dict[str, bool]:
+        """Unpause every paused container in parallel, returns the result per paused container"""
+        self.refresh_snapshot(containers)
+        paused = [name for name in containers if self._get_container_state(name) == 'paused']
+        self.invalidate_snapshot()
+        return self._run_parallel(self._unpause_container, paused, self.start_workers, self.start_timeout, "unpause")
+
+    def prepare_warm_standby(self, containers: List[str]) -> bool:
+        """
+        Keep the containers started but frozen with docker pause, so promoting this
+        node is a parallel unpause instead of a cold start. Stopped containers are
+        started and only paused once they're ready, so their memory is initialized.
+        """
+        self.refresh_snapshot(containers)
+        stopped = [name for name in containers if self._get_container_state(name) not in ('running', 'paused')]
+        if stopped and not self.start_all_containers(stopped):
+            self.logger.error("Failed to start containers for warm standby")
             return False
 
-    def become_backup(self, containers: List[str]):
+        self.invalidate_snapshot()
+        results = self._run_parallel(self._pause_container, containers, self.stop_workers, self.stop_timeout, "pause")
+        if all(results.values()):
+            self.logger.info("Warm standby ready, all containers are paused")
+            return True
+        return False
+
+    def notify_other_server(self) -> bool:
+        """
+        Ask the group's highest-priority live peer to take over, falling back to the
+        next one in priority order if it refuses or can't be reached.
+        """
+        for peer in self.cluster.successors(self.group):
+            try:
+                # The other server only answers once its containers are up, so allow a much longer read
+                response = peer.client.post(
+                    "/become_primary",
+                    {"server": self.server_name, "group": self.group, "epoch": self.epoch},
+                    read_timeout=server_configs.become_primary_timeout
+                )
+                if response.status_code == 200:
+                    self.logger.info(f"{peer.name} took over as primary for group {self.group}")
+                    return True
+                self.logger.error(f"{peer.name} failed to take over: HTTP {response.status_code}")
+            except Exception as e:
+                self.logger.error(f"Error notifying {peer.name}: {str(e)}")
+        return False
+
+    def _journal_role(self):
+        """Durably record the new role before acting on it, so a restart resumes from it"""
+        if self.journal is not None:
+            try:
+                self.journal.record(self.group, self.role.value, self.epoch)
+            except Exception as e:
+                self.logger.error(f"Failed to write the role journal: {str(e)}")
+
+    def become_backup(self, containers: List[str], release: bool = True):
+        """Give up the primary role. Pass release=False if the caller already released the containers."""
         self.role = ServerRole.BACKUP
-        self.logger.info(f"{self.server_name} transitioning to BACKUP role")
-        if self.stop_all_containers(containers):
-            self.logger.info("All containers stopped, now in backup mode")
-        else:
-            self.logger.error("Failed to stop all containers while transitioning to backup")
+        self.lease_expires_at = None
+        self._journal_role()
+        self.verifications.clear()
+        self.logger.info(f"{self.server_name} transitioning to BACKUP role for group {self.group}")
+        if release:
+            if all(self.release_containers(containers).values()):
+                self.logger.info("All containers released, now in backup mode")
+            else:
+                self.logger.error("Failed to release all containers while transitioning to backup")
+        # Start from a clean state rather than freezing whatever made us fail over
+        if self.warm_standby:
+            self.prepare_warm_standby(containers)
+
+    def restore_role(self, role: ServerRole, epoch: int):
+        """
+        Resume the role and epoch recorded in the journal before a restart. A restored
+        primary gets one lease period to have its lease renewed by a quorum, the same
+        as a node that starts out as primary, and steps down if that doesn't happen.
+        """
+        self.role = role
+        self.epoch = epoch
+        self.lease_expires_at = time.monotonic() + self.lease_duration if role == ServerRole.PRIMARY else None
 
-    def become_primary(self, containers: List[str]) -> bool:
+    def renew_lease(self, renewed_at: float):
+        """Extend the lease to lease_duration after the time a quorum last accepted us as primary"""
+        self.lease_expires_at = max(self.lease_expires_at or 0, renewed_at + self.lease_duration)
+
+    def lease_expired(self) -> bool:
+        """Whether we're primary without a valid lease and have to step down. A primary without any lease has none."""
+        return (self.role == ServerRole.PRIMARY and self.lease_duration > 0
+                and (self.lease_expires_at is None or time.monotonic() >= self.lease_expires_at))
+
+    def become_primary(self, containers: List[str], epoch: Optional[int] = None) -> bool:
         self.role = ServerRole.PRIMARY
-        self.logger.info(f"{self.server_name} transitioning to PRIMARY role")
-        return self.start_all_containers(containers)
+        self.epoch = epoch if epoch is not None else self.epoch + 1
+        self.lease_expires_at = time.monotonic() + self.lease_duration
+        self._journal_role()
+        self.verifications.clear()
+        self.logger.info(f"{self.server_name} transitioning to PRIMARY role for group {self.group} at epoch {self.epoch}")
+        self.frozen_until = None
+        if self.preflight is not None:
+            # Checks that passed recently in the background don't need to run again mid-outage
+            with FAILOVER_PHASE_SECONDS.labels(self.group, "preflight").time():
+                failed = self.preflight.ensure(self.preflight_max_age, containers)
+            for check in failed:
+                self.logger.warning(f"Pre-flight check {check.name} failed: {check.detail}")
+        # Warm standby and frozen containers only need to be unpaused; start_all_containers then skips them
+        # as already running and just waits for their readiness
+        with FAILOVER_PHASE_SECONDS.labels(self.group, "resume").time():
+            self.resume_paused_containers(containers)
+        with FAILOVER_PHASE_SECONDS.labels(self.group, "start").time():
+            return self.start_all_containers(containers)
 
 
-    def verify_container_health(self, container_name: str) -> bool:
+    def _advance_verification(self, container_name: str, is_running: bool, now: float) -> Optional[VerificationState]:
         """
-        Verify container health with consecutive checks and respect restart grace period
+        Move the container's verification state machine forward with a new observation:
+        suspect -> confirming -> confirmed_down, or recovered as soon as it's seen running.
+        Never sleeps; the next check is scheduled through next_check_at instead.
         """
-        # First check if the container is in restart grace period
-        if container_name in self.container_down_times:
-            time_since_down = time.time() - self.container_down_times[container_name]
-            if time_since_down < self.restart_grace_period:
-                self.logger.info(f"Container {container_name} is in restart grace period, {int(self.restart_grace_period - time_since_down)}s remaining")
-                return True  # Consider container healthy during grace period
-        
-        # Perform multiple checks to verify container is actually down
-        consecutive_checks = 3
-        check_interval = 5  # seconds
-        
-        for i in range(consecutive_checks):
-            if self.get_container_status(container_name):
-                return True
-            
-            if i < consecutive_checks - 1:  # Don't sleep after last check
-                time.sleep(check_interval)
-        
-        # If we get here, container has been down for more than grace period
-        time_since_down = time.time() - self.container_down_times[container_name]
-        if time_since_down >= self.restart_grace_period:
-            self.logger.error(f"Container {container_name} has been down for {int(time_since_down)}s, exceeding grace period")
-            return False
-        
-        return True
+        verification = self.verifications.get(container_name)
+        if is_running:
+            if verification is not None:
+                del self.verifications[container_name]
+                VERIFICATION_SECONDS.labels(self.group, "recovered").observe(now - verification.down_since)
+                self.logger.info(f"Container {container_name} recovered during verification")
+                return VerificationState.RECOVERED
+            return None
+
+        if verification is None:
+            down_since = self.container_down_times.get(container_name, now)
+            verification = ContainerVerification(
+                state=VerificationState.SUSPECT,
+                down_since=down_since,
+                next_check_at=down_since + self.restart_grace_period
+            )
+            self.verifications[container_name] = verification
+            self.logger.info(f"Verifying container {container_name} once its restart grace period is over")
+
+        if verification.state == VerificationState.CONFIRMED_DOWN or now < verification.next_check_at:
+            return verification.state
+
+        if verification.state == VerificationState.SUSPECT:
+            self.logger.info(f"Container {container_name} still down after restart grace period, confirming...")
+            verification.state = VerificationState.CONFIRMING
+
+        verification.failed_checks += 1
+        if verification.failed_checks >= self.verification_checks:
+            verification.state = VerificationState.CONFIRMED_DOWN
+            VERIFICATION_SECONDS.labels(self.group, "confirmed_down").observe(now - verification.down_since)
+            self.logger.error(f"Container {container_name} has been down for {int(now - verification.down_since)}s, exceeding grace period")
+        else:
+            verification.next_check_at = now + self.verification_interval
+        return verification.state
+
+    def check_containers(self, containers: List[str]) -> List[str]:
+        """
+        Run one monitoring cycle: take a snapshot and advance the verification
+        state machine of every container. Many containers can be under verification
+        at the same time without blocking each other.
+        Returns the containers confirmed down.
+        """
+        self.refresh_snapshot(containers)
+        self.update_state_digest(containers)
+        if self.starting:
+            return []
+        now = time.monotonic()
+        confirmed_down = []
+        for container_name in containers:
+            if not self.should_check_container(container_name):
+                continue
+            is_running = self.get_container_status(container_name)
+            CONTAINER_UP.labels(self.group, container_name).set(1 if is_running else 0)
+            if self._advance_verification(container_name, is_running, now) == VerificationState.CONFIRMED_DOWN:
+                confirmed_down.append(container_name)
+        return confirmed_down
+
+    def confirmed_down(self, containers: List[str]) -> List[str]:
+        """The given containers whose verification still stands at confirmed down"""
+        return [name for name in containers
+                if name in self.verifications and self.verifications[name].state == VerificationState.CONFIRMED_DOWN]
+
+    def next_check_delay(self, max_delay: float) -> float:
+        """
+        Seconds until the monitoring loop has to run again: the earliest scheduled
+        verification check, the end of the startup grace period, the end of the
+        freeze retention window or the expiry of our lease, capped at max_delay.
+        """
+        now = time.monotonic()
+        deadlines = [v.next_check_at for v in self.verifications.values()
+                     if v.state in (VerificationState.SUSPECT, VerificationState.CONFIRMING)]
+        if self.container_start_time is not None:
+            grace_end = self.container_start_time + self.startup_grace_period
+            if grace_end > now:
+                deadlines.append(grace_end)
+        if self.frozen_until is not None:
+            deadlines.append(self.frozen_until)
+        if self.role == ServerRole.PRIMARY and self.lease_duration > 0 and self.lease_expires_at is not None:
+            deadlines.append(self.lease_expires_at)
+        if not deadlines:
+            return max_delay
+        return max(0, min(min(deadlines) - now, max_delay))
 
     def monitor_containers(self, containers: List[str]):
         self.logger.info(f"Starting monitor in {self.role.value} mode")
@@ -206,29 +783,21 @@ class ContainerMonitor:
         
         while True:
             if self.role == ServerRole.PRIMARY:
-                # Skip checks during grace period
-                time_since_start = time.time() - self.container_start_time
-                if time_since_start < self.startup_grace_period:
-                    self.logger.info(f"In grace period, {int(self.startup_grace_period - time_since_start)}s remaining")
-                    time.sleep(30)
-                    continue
-
-                for container_name in containers:
-                    # Perform multiple checks to verify container is actually down
-                    if not self.verify_container_health(container_name):
-                        self.logger.warning(f"Container {container_name} failed health check!")
+                for container_name in self.check_containers(containers):
+                    self.logger.warning(f"Container {container_name} failed health check!")
+                    
+                    # Stop all containers and transition to backup
+                    if all(self.stop_all_containers(containers).values()):
+                        self.logger.info("All containers stopped successfully")
                         
-                        # Stop all containers and transition to backup
-                        if self.stop_all_containers(containers):
-                            self.logger.info("All containers stopped successfully")
-                            
-                            # Notify other server to become primary
-                            if self.notify_other_server():
-                                self.logger.info("Other server notified successfully")
-                                self.become_backup(containers)
-                            else:
-                                self.logger.error("Failed to notify other server")
+                        # Notify other server to become primary
+                        if self.notify_other_server():
+                            self.logger.info("Other server notified successfully")
+                            self.become_backup(containers, release=False)
                         else:
-                            self.logger.error("Failed to stop all containers")
+                            self.logger.error("Failed to notify other server")
+                    else:
+                        self.logger.error("Failed to stop all containers")
+                    break
             
-            time.sleep(50)
+            self.wait_for_events(self.next_check_delay(server_configs.reconcile_interval))
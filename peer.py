@@ -0,0 +1,66 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PeerClient:
+    """
+    Shared HTTP client for calls to another failover agent.
+    Keeps connections alive between calls, applies separate connect and read
+    timeouts to every request and records round-trip times.
+    """
+    def __init__(self, base_url: str, connect_timeout: float = 1, read_timeout: float = 5,
+                 pool_size: int = 4, rtt_window: int = 100):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.rtts = deque(maxlen=rtt_window)  # Seconds taken by the most recent successful calls
+        self.last_rtt = None
+
+    def post(self, path: str, payload: dict, read_timeout: Optional[float] = None) -> requests.Response:
+        """
+        POST a JSON payload to the peer. Connecting may take at most connect_timeout
+        seconds and every read at most read_timeout (or the given override) seconds.
+        """
+        start_time = time.monotonic()
+        response = self.session.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            timeout=(self.connect_timeout, read_timeout or self.read_timeout)
+        )
+        self.last_rtt = time.monotonic() - start_time
+        self.rtts.append(self.last_rtt)
+        return response
+
+    async def post_async(self, path: str, payload: dict, deadline: float) -> requests.Response:
+        """
+        POST from a coroutine with a hard deadline for the whole call.
+        Raises asyncio.TimeoutError if the peer doesn't answer within deadline seconds.
+        """
+        read_timeout = min(self.read_timeout, deadline)
+        return await asyncio.wait_for(asyncio.to_thread(self.post, path, payload, read_timeout), deadline)
+
+    def rtt_summary(self) -> Dict[str, float]:
+        """Round-trip time statistics over the recent calls, in seconds"""
+        if not self.rtts:
+            return {"samples": 0}
+        samples = sorted(self.rtts)
+        return {
+            "samples": len(samples),
+            "last": self.last_rtt,
+            "min": samples[0],
+            "avg": sum(samples) / len(samples),
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": samples[-1],
+        }
+
+    def close(self):
+        self.session.close()
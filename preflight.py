@@ -0,0 +1,168 @@
+import errno
+import logging
+import shutil
+import socket
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+import docker
+
+
+@dataclass
+class CheckResult:
+    name: str
+    passed: bool
+    detail: str
+    checked_at: float  # monotonic time
+
+
+def _available_memory_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _port_is_free(host_ip: str, port: int, protocol: str) -> bool:
+    sock_type = socket.SOCK_DGRAM if protocol == "udp" else socket.SOCK_STREAM
+    with socket.socket(socket.AF_INET, sock_type) as sock:
+        try:
+            sock.bind((host_ip or "0.0.0.0", port))
+            return True
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                return False
+            raise
+
+
+class PreflightChecker:
+    """
+    Checks ahead of time that this node could take over: the containers exist,
+    their images are present locally, their published ports are free and there
+    is enough memory and disk. Results are cached per container so a promotion
+    only needs to re-run the checks that failed or went stale.
+    """
+    def __init__(self, docker_client, containers: List[str], logger: logging.Logger,
+                 min_free_memory_mb: int = 0, min_free_disk_mb: int = 0,
+                 disk_path: str = "/", check_ports: bool = True):
+        self.docker_client = docker_client
+        self.containers = containers
+        self.logger = logger
+        self.min_free_memory = min_free_memory_mb * 1024 * 1024
+        self.min_free_disk = min_free_disk_mb * 1024 * 1024
+        self.disk_path = disk_path
+        self.check_ports = check_ports
+        self.results: Dict[str, List[CheckResult]] = {}  # container name (or "host") -> its checks
+        self._lock = threading.Lock()
+
+    def _check_container(self, container_name: str) -> List[CheckResult]:
+        now = time.monotonic()
+        try:
+            attrs = self.docker_client.api.inspect_container(container_name)
+        except docker.errors.NotFound:
+            return [CheckResult(f"container:{container_name}", False, "container not found", now)]
+        results = [CheckResult(f"container:{container_name}", True, "container exists", now)]
+
+        image = attrs.get("Image")
+        try:
+            self.docker_client.api.inspect_image(image)
+            results.append(CheckResult(f"image:{container_name}", True, f"image {image[:19]} present", now))
+        except docker.errors.ImageNotFound:
+            results.append(CheckResult(f"image:{container_name}", False, f"image {image[:19]} missing locally", now))
+
+        # A running or paused (warm standby) container already holds its ports and memory
+        if attrs.get("State", {}).get("Status") in ("running", "paused"):
+            return results
+
+        if self.check_ports:
+            for container_port, bindings in (attrs.get("HostConfig", {}).get("PortBindings") or {}).items():
+                protocol = container_port.split("/")[-1]
+                for binding in bindings or []:
+                    if not binding.get("HostPort"):
+                        continue
+                    host_port = int(binding["HostPort"])
+                    free = _port_is_free(binding.get("HostIp", ""), host_port, protocol)
+                    results.append(CheckResult(
+                        f"port:{container_name}:{host_port}/{protocol}",
+                        free,
+                        "port is free" if free else "port is already in use",
+                        now
+                    ))
+
+        memory_limit = attrs.get("HostConfig", {}).get("Memory") or 0
+        if memory_limit:
+            available = _available_memory_bytes()
+            if available is not None:
+                results.append(CheckResult(
+                    f"memory:{container_name}",
+                    available >= memory_limit,
+                    f"{available // 2**20}MB available, container limit {memory_limit // 2**20}MB",
+                    now
+                ))
+        return results
+
+    def _check_host(self) -> List[CheckResult]:
+        now = time.monotonic()
+        results = []
+        free_disk = shutil.disk_usage(self.disk_path).free
+        results.append(CheckResult(
+            "disk",
+            free_disk >= self.min_free_disk,
+            f"{free_disk // 2**20}MB free on {self.disk_path}",
+            now
+        ))
+        available = _available_memory_bytes()
+        if available is not None:
+            results.append(CheckResult(
+                "memory",
+                available >= self.min_free_memory,
+                f"{available // 2**20}MB available",
+                now
+            ))
+        return results
+
+    def _run_subject(self, subject: str) -> List[CheckResult]:
+        try:
+            results = self._check_host() if subject == "host" else self._check_container(subject)
+        except Exception as e:
+            results = [CheckResult(f"check:{subject}", False, f"check failed: {str(e)}", time.monotonic())]
+        with self._lock:
+            self.results[subject] = results
+        return results
+
+    def run(self) -> List[CheckResult]:
+        """Run every check and return the failed ones"""
+        return self.ensure(max_age=0)
+
+    def ensure(self, max_age: float, containers: Optional[List[str]] = None) -> List[CheckResult]:
+        """
+        Re-run only the checks that failed or are older than max_age seconds,
+        keep the ones that passed recently. Only the given containers are checked
+        if any are given. Returns the failed checks.
+        """
+        now = time.monotonic()
+        failed = []
+        for subject in ["host"] + list(containers if containers is not None else self.containers):
+            with self._lock:
+                cached = self.results.get(subject)
+            if cached and all(r.passed and now - r.checked_at <= max_age for r in cached):
+                continue
+            failed.extend(r for r in self._run_subject(subject) if not r.passed)
+        return failed
+
+    def as_dict(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            checks = [dict(asdict(r), age=now - r.checked_at) for results in self.results.values() for r in results]
+        for check in checks:
+            del check["checked_at"]
+        return {
+            "ready": bool(checks) and all(check["passed"] for check in checks),
+            "checks": checks,
+        }
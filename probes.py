@@ -0,0 +1,51 @@
+import logging
+import socket
+import time
+
+import requests
+
+from config import ReadinessProbe
+
+PROBE_TYPES = ("http", "tcp", "exec")
+EXEC_POLL_INTERVAL = 0.05  # seconds between checks whether an exec probe's command has exited
+
+
+def run_probe(probe: ReadinessProbe, container_name: str, docker_client, logger: logging.Logger) -> bool:
+    """
+    Run a single readiness probe attempt against a container, bounded by probe.timeout.
+    An attempt that doesn't finish in time counts as failed.
+    """
+    try:
+        if probe.type == "http":
+            response = requests.get(probe.url, timeout=probe.timeout)
+            return response.status_code == probe.expected_status
+        if probe.type == "tcp":
+            with socket.create_connection((probe.host, probe.port), timeout=probe.timeout):
+                return True
+        if probe.type == "exec":
+            return _run_exec_probe(probe, container_name, docker_client, logger)
+        logger.error(f"Unknown readiness probe type {probe.type!r} for container {container_name}")
+        return False
+    except Exception as e:
+        logger.debug(f"Readiness probe for container {container_name} failed: {str(e)}")
+        return False
+
+
+def _run_exec_probe(probe: ReadinessProbe, container_name: str, docker_client, logger: logging.Logger) -> bool:
+    """
+    Start the command detached and poll its exit code until probe.timeout, so a hung
+    command can't hold a Docker worker. Docker can't kill an exec, so a command that
+    times out is left running in the container.
+    """
+    api = docker_client.api
+    exec_id = api.exec_create(container_name, probe.command)["Id"]
+    api.exec_start(exec_id, detach=True)
+    deadline = time.monotonic() + probe.timeout
+    while True:
+        result = api.exec_inspect(exec_id)
+        if not result["Running"] and result["ExitCode"] is not None:
+            return result["ExitCode"] == 0
+        if time.monotonic() >= deadline:
+            logger.warning(f"Readiness probe command in container {container_name} didn't exit within {probe.timeout}s")
+            return False
+        time.sleep(EXEC_POLL_INTERVAL)
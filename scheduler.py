@@ -0,0 +1,49 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict
+
+
+class MonotonicTicker:
+    """
+    Fires at fixed deadlines start + n * interval on the monotonic clock, however long
+    the work done on each tick takes. Ticks that can't be met any more are skipped
+    rather than fired in a burst. Supports fractional-second intervals and keeps
+    the measured scheduling jitter (how late each tick fired) for the recent ticks.
+    """
+    def __init__(self, interval: float, jitter_window: int = 100):
+        self.interval = interval
+        self.jitter = deque(maxlen=jitter_window)  # seconds each recent tick fired after its deadline
+        self.missed_ticks = 0
+
+    async def ticks(self):
+        """Async iterator yielding once per deadline"""
+        next_deadline = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now < next_deadline:
+                await asyncio.sleep(next_deadline - now)
+                now = time.monotonic()
+            self.jitter.append(now - next_deadline)
+            yield next_deadline
+
+            next_deadline += self.interval
+            now = time.monotonic()
+            if now >= next_deadline + self.interval:
+                # We fell more than a whole interval behind, skip to the upcoming deadline
+                skipped = int((now - next_deadline) // self.interval)
+                self.missed_ticks += skipped
+                next_deadline += skipped * self.interval
+
+    def jitter_summary(self) -> Dict[str, float]:
+        """Scheduling jitter statistics over the recent ticks, in seconds"""
+        if not self.jitter:
+            return {"samples": 0, "missed_ticks": self.missed_ticks}
+        samples = sorted(self.jitter)
+        return {
+            "samples": len(samples),
+            "missed_ticks": self.missed_ticks,
+            "avg": sum(samples) / len(samples),
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": samples[-1],
+        }
@@ -0,0 +1,80 @@
+import logging
+import os
+
+import pytest
+
+from disk_lease import SLOT_SIZE, DiskLease, LeaseSlot, decode_slot, encode_slot
+
+
+def make_lease(path, node_name, groups=("default",), lease_duration=0.05):
+    return DiskLease(str(path), node_name, list(groups), slots=4, lease_duration=lease_duration,
+                     settle_delay=0, logger=logging.getLogger("test"))
+
+
+def test_slot_round_trip():
+    slot = LeaseSlot("payments", "server1", 7, 42)
+    data = encode_slot(slot)
+    assert len(data) == SLOT_SIZE
+    assert decode_slot(data) == slot
+
+
+def test_corrupt_slot_is_rejected():
+    data = bytearray(encode_slot(LeaseSlot("default", "server1", 1, 0)))
+    data[20] ^= 0xFF
+    assert decode_slot(bytes(data)) is None
+
+
+def test_names_longer_than_a_slot_field_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_lease(tmp_path / "lease", "server1", groups=["payments-service-db"])
+    with pytest.raises(ValueError):
+        make_lease(tmp_path / "lease", "a-very-long-node-name-01")
+    with pytest.raises(ValueError):
+        encode_slot(LeaseSlot("default", "a-very-long-node-name-01", 1, 0))
+
+
+def test_names_of_exactly_sixteen_bytes_are_kept(tmp_path):
+    lease = make_lease(tmp_path / "lease", "node-sixteen-byt", groups=["group-sixteen-by"])
+    renewed, slot = lease.renew("group-sixteen-by", 1)
+    assert renewed
+    assert lease.observe("group-sixteen-by") == LeaseSlot("group-sixteen-by", "node-sixteen-byt", 1, 0)
+    lease.close()
+
+
+def test_renew_bumps_the_counter(tmp_path):
+    lease = make_lease(tmp_path / "lease", "server1")
+    assert lease.renew("default", 1) == (True, LeaseSlot("default", "server1", 1, 0))
+    assert lease.renew("default", 1) == (True, LeaseSlot("default", "server1", 1, 1))
+    lease.close()
+
+
+def test_renew_fails_once_another_node_took_over(tmp_path):
+    server1 = make_lease(tmp_path / "lease", "server1")
+    server2 = make_lease(tmp_path / "lease", "server2")
+    assert server1.renew("default", 1)[0]
+    server2.renew("default", 2)
+    renewed, slot = server1.renew("default", 1)
+    assert not renewed
+    assert (slot.owner, slot.epoch) == ("server2", 2)
+    server1.close()
+    server2.close()
+
+
+def test_acquire_waits_until_the_owner_stops_renewing(tmp_path):
+    server1 = make_lease(tmp_path / "lease", "server1")
+    server2 = make_lease(tmp_path / "lease", "server2")
+    server1.renew("default", 1)
+    assert not server2.acquire("default", 2)  # counter only just seen moving
+    server2.observed["default"] = (server2.observed["default"][0], 0)  # last moved long ago
+    assert server2.acquire("default", 2)
+    assert not server2.acquire("default", 2)  # not newer than the slot's epoch
+    server1.close()
+    server2.close()
+
+
+def test_file_with_another_slot_count_is_rejected(tmp_path):
+    make_lease(tmp_path / "lease", "server1").close()
+    with pytest.raises(ValueError):
+        DiskLease(str(tmp_path / "lease"), "server1", ["default"], slots=8, lease_duration=1,
+                  settle_delay=0, logger=logging.getLogger("test"))
+    assert os.path.getsize(tmp_path / "lease") == SLOT_SIZE * 5
@@ -0,0 +1,57 @@
+import logging
+import time
+
+import pytest
+
+pytest.importorskip("docker")
+
+from journal import RoleJournal
+from monitor import ContainerMonitor, ServerRole
+
+
+def make_monitor(initial_role: ServerRole) -> ContainerMonitor:
+    monitor = ContainerMonitor(
+        server_name="server2",
+        cluster=None,
+        initial_role=initial_role,
+        containers=["app"],
+        docker_client=object()
+    )
+    monitor.lease_duration = 0.05
+    return monitor
+
+
+def test_restored_primary_on_backup_node_steps_down_without_renewal(tmp_path):
+    logger = logging.getLogger("test")
+    journal = RoleJournal(str(tmp_path), "server2", logger)
+    journal.load()
+    journal.record("default", ServerRole.PRIMARY.value, 3)
+    journal.close()
+
+    # Configured as backup, so __init__ gives it no lease
+    monitor = make_monitor(ServerRole.BACKUP)
+    assert monitor.lease_expires_at is None
+
+    restored = RoleJournal(str(tmp_path), "server2", logger).load()
+    role, epoch = restored["default"]
+    monitor.restore_role(ServerRole(role), epoch)
+
+    assert monitor.role == ServerRole.PRIMARY
+    assert monitor.epoch == 3
+    assert monitor.lease_expires_at is not None
+    assert not monitor.lease_expired()
+    time.sleep(monitor.lease_duration * 2)
+    assert monitor.lease_expired()
+
+
+def test_restored_backup_has_no_lease():
+    monitor = make_monitor(ServerRole.PRIMARY)
+    monitor.restore_role(ServerRole.BACKUP, 5)
+    assert monitor.lease_expires_at is None
+    assert not monitor.lease_expired()
+
+
+def test_primary_without_lease_counts_as_expired():
+    monitor = make_monitor(ServerRole.PRIMARY)
+    monitor.lease_expires_at = None
+    assert monitor.lease_expired()
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+# magic, version, node id, epoch, sequence number, send timestamp
+PACKET_FORMAT = struct.Struct("!4sB16sQQd")
+PACKET_MAGIC = b"FOHB"
+PACKET_VERSION = 2
+DIGEST_SIZE = 16  # truncated HMAC-SHA256
+PACKET_SIZE = PACKET_FORMAT.size + DIGEST_SIZE
+MAX_NODE_ID_BYTES = 16  # node names are sent in a fixed 16-byte field
+
+
+@dataclass
+class HeartbeatPacket:
+    node_id: str
+    epoch: int
+    sequence: int
+    sent_at: float  # sender's wall clock, used to reject stale packets
+
+
+def encode_packet(packet: HeartbeatPacket, secret: bytes) -> bytes:
+    """Pack a heartbeat into a fixed-size datagram signed with the shared secret"""
+    if len(packet.node_id.encode()) > MAX_NODE_ID_BYTES:
+        raise ValueError(f"Node name {packet.node_id!r} is longer than the {MAX_NODE_ID_BYTES} bytes a heartbeat datagram can hold")
+    body = PACKET_FORMAT.pack(
+        PACKET_MAGIC,
+        PACKET_VERSION,
+        packet.node_id.encode(),
+        packet.epoch,
+        packet.sequence,
+        packet.sent_at
+    )
+    return body + hmac.new(secret, body, hashlib.sha256).digest()[:DIGEST_SIZE]
+
+
+def decode_packet(data: bytes, secret: bytes) -> Optional[HeartbeatPacket]:
+    """Returns the heartbeat, or None if the datagram is malformed or its signature doesn't match"""
+    if len(data) != PACKET_SIZE:
+        return None
+    body, digest = data[:PACKET_FORMAT.size], data[PACKET_FORMAT.size:]
+    if not hmac.compare_digest(digest, hmac.new(secret, body, hashlib.sha256).digest()[:DIGEST_SIZE]):
+        return None
+    magic, version, node_id, epoch, sequence, sent_at = PACKET_FORMAT.unpack(body)
+    if magic != PACKET_MAGIC or version != PACKET_VERSION:
+        return None
+    return HeartbeatPacket(node_id.rstrip(b"\0").decode(errors="replace"), epoch, sequence, sent_at)
+
+
+@dataclass
+class SenderStats:
+    epoch: int
+    highest_sequence: int
+    received: int = 0
+    lost: int = 0          # sequence numbers skipped, minus those that showed up late
+    reordered: int = 0     # packets that arrived after a higher sequence number
+    duplicates: int = 0
+    stale: int = 0         # packets too old to tell apart from a replay
+
+
+class UdpHeartbeatProtocol(asyncio.DatagramProtocol):
+    """
+    Receives heartbeat datagrams, drops anything unsigned or replayed and keeps
+    loss and reordering statistics per sending node. Every accepted heartbeat is
+    handed to the callback with the sender's node id.
+    A packet is only accepted once per sender epoch and sequence number: sequence
+    numbers more than reorder_window behind the highest one seen are dropped, as
+    are packets sent more than max_age seconds ago, so a captured datagram can't
+    be replayed to keep a dead node looking alive.
+    """
+    def __init__(self, secret: bytes, callback: Callable[[str, HeartbeatPacket], None],
+                 logger: logging.Logger, reorder_window: int = 64, max_age: float = 5.0):
+        self.secret = secret
+        self.callback = callback
+        self.logger = logger
+        self.reorder_window = reorder_window
+        self.max_age = max_age  # seconds, must cover the clock skew between the nodes
+        self.stats: Dict[str, SenderStats] = {}
+        self._seen: Dict[str, set] = {}  # recent sequence numbers per node, to spot duplicates
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        packet = decode_packet(data, self.secret)
+        if packet is None:
+            self.logger.warning(f"Dropped invalid heartbeat datagram from {addr[0]}")
+            return
+        if abs(time.time() - packet.sent_at) > self.max_age:
+            self.logger.warning(f"Dropped stale heartbeat datagram from {packet.node_id} at {addr[0]}")
+            stats = self.stats.get(packet.node_id)
+            if stats is not None:
+                stats.stale += 1
+            return
+
+        stats = self.stats.get(packet.node_id)
+        if stats is None or packet.epoch > stats.epoch:
+            # First packet from this node or the sender restarted
+            stats = SenderStats(epoch=packet.epoch, highest_sequence=packet.sequence - 1)
+            self.stats[packet.node_id] = stats
+            self._seen[packet.node_id] = set()
+        elif packet.epoch < stats.epoch:
+            return  # left over from before the sender restarted
+
+        seen = self._seen[packet.node_id]
+        if packet.sequence in seen:
+            stats.duplicates += 1
+            return
+        if packet.sequence <= stats.highest_sequence - self.reorder_window:
+            # Too old to still be in seen, so it can't be told apart from a replay
+            stats.stale += 1
+            return
+
+        if packet.sequence > stats.highest_sequence:
+            gap = packet.sequence - stats.highest_sequence - 1
+            if gap:
+                stats.lost += gap
+                self.logger.debug(f"Missed {gap} heartbeats from {packet.node_id}")
+            stats.highest_sequence = packet.sequence
+        else:
+            stats.reordered += 1
+            stats.lost = max(0, stats.lost - 1)
+        stats.received += 1
+
+        seen.add(packet.sequence)
+        if len(seen) > self.reorder_window:
+            seen.difference_update([seq for seq in seen if seq <= stats.highest_sequence - self.reorder_window])
+
+        self.callback(packet.node_id, packet)
+
+
+class UdpHeartbeatSender:
+    """Sends signed, sequenced heartbeat datagrams to every peer"""
+    def __init__(self, node_id: str, peer_addresses: List[Tuple[str, int]], secret: bytes, epoch: Optional[int] = None):
+        self.node_id = node_id
+        self.peer_addresses = peer_addresses
+        self.secret = secret
+        # Unique per agent start and higher than the previous one, even for restarts within a second
+        self.epoch = epoch if epoch is not None else time.time_ns()
+        self.sequence = 0
+        self._transport = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol,
+            local_addr=("0.0.0.0", 0)
+        )
+
+    def send(self):
+        self.sequence += 1
+        data = encode_packet(
+            HeartbeatPacket(self.node_id, self.epoch, self.sequence, time.time()),
+            self.secret
+        )
+        for address in self.peer_addresses:
+            self._transport.sendto(data, address)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+
+async def start_udp_receiver(port: int, secret: bytes, callback: Callable[[str, HeartbeatPacket], None],
+                             logger: logging.Logger, max_age: float = 5.0) -> Tuple[asyncio.DatagramTransport, UdpHeartbeatProtocol]:
+    """Listen for heartbeat datagrams on all interfaces"""
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(
+        lambda: UdpHeartbeatProtocol(secret, callback, logger, max_age=max_age),
+        local_addr=("0.0.0.0", port)
+    )
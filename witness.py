@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from config import GENERAL_CONFIG
+from failure_detector import PhiAccrualFailureDetector
+
+server_configs = GENERAL_CONFIG
+
+
+class Witness:
+    """
+    Tie-breaker for failover decisions. Runs without containers; every node
+    heartbeats it, and a backup needs its vote before taking a group over.
+    The witness only votes for a takeover once it can't reach the group's
+    primary either, so a broken link between the nodes can't cause split brain.
+    It also counts towards the quorum that renews a primary's lease.
+    """
+    def __init__(self, nodes: List[str], logger: logging.Logger):
+        self.nodes = nodes
+        self.logger = logger
+        self.failure_detectors = {
+            name: PhiAccrualFailureDetector(
+                threshold=server_configs.phi_threshold,
+                window_size=server_configs.phi_window_size,
+                min_std_deviation=server_configs.phi_min_std_deviation,
+                acceptable_pause=server_configs.phi_acceptable_pause
+            )
+            for name in nodes
+        }
+        self.last_heartbeat: Dict[str, float] = {}  # node -> monotonic time of its last heartbeat
+        self.primaries: Dict[str, Tuple[str, int]] = {}  # group -> (primary node, epoch) at the highest known epoch
+        self._lock = threading.Lock()
+
+    def is_suspected(self, name: str, now: float) -> bool:
+        """Same rule as the nodes use: phi over the threshold, or no heartbeat for heartbeat_timeout or the lease"""
+        last_heartbeat = self.last_heartbeat.get(name)
+        if last_heartbeat is None:
+            return True
+        if now - last_heartbeat < server_configs.lease_duration:
+            return False
+        if now - last_heartbeat > server_configs.heartbeat_timeout:
+            return True
+        detector = self.failure_detectors[name]
+        return detector.phi(now) >= detector.threshold
+
+    def record_heartbeat(self, name: str, roles: Dict[str, str], epochs: Dict[str, int]) -> List[str]:
+        """
+        Record a node's heartbeat and its primary claims.
+        Returns the groups whose lease we grant it: those it's primary for at the latest epoch.
+        """
+        now = time.monotonic()
+        grants = []
+        with self._lock:
+            self.last_heartbeat[name] = now
+            self.failure_detectors[name].heartbeat(now)
+            for group, role in roles.items():
+                if role != "primary":
+                    continue
+                epoch = epochs.get(group, 0)
+                known = self.primaries.get(group)
+                if known is None or epoch > known[1] or (epoch == known[1] and known[0] == name):
+                    self.primaries[group] = (name, epoch)
+                    grants.append(group)
+                else:
+                    self.logger.warning(f"Ignored stale primary claim from {name} for group {group} at epoch {epoch}")
+        return grants
+
+    def epochs(self) -> Dict[str, int]:
+        with self._lock:
+            return {group: epoch for group, (_, epoch) in self.primaries.items()}
+
+    def vote(self, candidate: str, group: str, epoch: int) -> Tuple[bool, str]:
+        """
+        Decide whether candidate may take over group at epoch. Granted only for a newer
+        epoch than any seen for the group, and only if the group's primary is lost to us too.
+        A granted vote makes the candidate the group's primary at that epoch.
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = self.primaries.get(group)
+            if known is not None:
+                primary, known_epoch = known
+                if epoch <= known_epoch:
+                    return False, f"epoch {epoch} isn't newer than {known_epoch}"
+                if primary != candidate and not self.is_suspected(primary, now):
+                    return False, f"primary {primary} is still alive"
+            self.primaries[group] = (candidate, epoch)
+        self.logger.info(f"Voted for {candidate} to take over group {group} at epoch {epoch}")
+        return True, "granted"
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "nodes": {
+                    name: {
+                        "seconds_since_last_heartbeat": now - self.last_heartbeat[name],
+                        "phi": self.failure_detectors[name].phi(now),
+                        "suspected": self.is_suspected(name, now),
+                    }
+                    for name in self.nodes if name in self.last_heartbeat
+                },
+                "primaries": {group: {"server": name, "epoch": epoch} for group, (name, epoch) in self.primaries.items()},
+            }